@@ -0,0 +1,112 @@
+"""Benchmark of the pizza evaluation and the optimizer against the size of the ingredient catalog.
+
+Builds random catalogs with n ingredients of every type, writes and loads them as .csv/.npz and
+reports the time of the loads, of the name lookups, of evaluating a menu of random pizzas and of
+the optimizer backends (enumeration only while the candidates fit the default threshold).
+
+    python -m benchmarks.bench_catalog_scaling [n_per_type ...]
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Tuple
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import (
+    IngredientCatalog,
+    IngredientType,
+    load_catalog,
+    save_catalog,
+)
+from maestro_pizza_maker.pizza import PIZZA_FIELDS, Pizza
+from maestro_pizza_maker.pizza_menu import PizzaMenu
+from maestro_pizza_maker.pizza_optimizer import (
+    ENUMERATION_THRESHOLD,
+    PizzaConstraintsIngredients,
+    PizzaConstraintsValues,
+    PizzaOptimizer,
+    ValueBounds,
+    count_candidate_pizzas,
+)
+
+N_SIMULATIONS = 1000
+N_PIZZAS = 1000
+
+
+def random_catalog(n_per_type: int, seed: int = 0) -> IngredientCatalog:
+    rng = np.random.default_rng(seed)
+    types = [ingredient_type for ingredient_type in IngredientType for _ in range(n_per_type)]
+    return IngredientCatalog.from_columns(
+        keys=[f"{ingredient_type.name}_{i}" for i, ingredient_type in enumerate(types)],
+        types=types,
+        nutrients=rng.uniform(0.5, 50, size=(len(types), 4)),
+        fat=rng.uniform(1, 30, size=(len(types), N_SIMULATIONS)),
+    )
+
+
+def random_pizza(catalog: IngredientCatalog, rng: np.random.Generator) -> Pizza:
+    ingredients = {}
+    for ingredient_type, field_name in PIZZA_FIELDS.items():
+        of_type = catalog.ingredients_of_type(ingredient_type)
+        count = 1 if field_name in ("dough", "sauce") else int(rng.integers(0, 3))
+        chosen = [of_type[i] for i in rng.choice(len(of_type), size=count, replace=False)]
+        ingredients[field_name] = chosen[0] if field_name in ("dough", "sauce") else chosen
+    return Pizza(**ingredients)
+
+
+def timed(function, repeat: int = 1) -> Tuple[float, Any]:
+    # mean milliseconds per call and the result of the last call
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return 1000 * (time.perf_counter() - start) / repeat, result
+
+
+def main(*sizes: int) -> None:
+    sizes = sizes or (4, 16, 64, 256)
+    constraints_values = PizzaConstraintsValues(calories=ValueBounds(min=50, max=200))
+    constraints_ingredients = PizzaConstraintsIngredients(cheese=1, meat=2, vegetables=1)
+    print(
+        f"{'ingredients':>11} {'csv load':>9} {'npz load':>9} {'lookup':>8} {'menu eval':>10}"
+        f" {'mip build':>10} {'mip solve':>10} {'enumerate':>10}   (ms, lookup in us)"
+    )
+    for n_per_type in sizes:
+        catalog = random_catalog(n_per_type)
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = save_catalog(catalog, os.path.join(directory, "catalog.csv"))
+            npz_path = save_catalog(catalog, os.path.join(directory, "catalog.npz"), include_fat=True)
+            csv_time, _ = timed(lambda: load_catalog(csv_path, fat=catalog.fat))
+            npz_time, _ = timed(lambda: load_catalog(npz_path).fat)
+        keys = list(catalog.keys)
+        lookup_time, _ = timed(lambda: [catalog[key] for key in keys], repeat=10)
+        lookup_time = 1000 * lookup_time / len(keys)
+
+        rng = np.random.default_rng(1)
+        pizzas = [random_pizza(catalog, rng) for _ in range(N_PIZZAS)]
+        eval_time, _ = timed(lambda: PizzaMenu(pizzas=list(pizzas)).batch.taste.mean(axis=1))
+
+        optimizer = PizzaOptimizer(backend="mip", catalog=catalog)
+        build_time, _ = timed(
+            lambda: optimizer.maximize_taste_penalty_price(constraints_values, constraints_ingredients, 0.1)
+        )
+        solve_time, _ = timed(
+            lambda: optimizer.maximize_taste_penalty_price(constraints_values, constraints_ingredients, 0.2),
+            repeat=5,
+        )
+        enumeration = "-"
+        if count_candidate_pizzas(constraints_ingredients, catalog) <= ENUMERATION_THRESHOLD:
+            enumerator = PizzaOptimizer(backend="enumeration", catalog=catalog)
+            enumeration_time, _ = timed(
+                lambda: enumerator.maximize_taste_penalty_price(constraints_values, constraints_ingredients, 0.2)
+            )
+            enumeration = f"{enumeration_time:10.2f}"
+        print(
+            f"{len(catalog):>11} {csv_time:9.2f} {npz_time:9.2f} {lookup_time:8.3f} {eval_time:10.2f}"
+            f" {build_time:10.2f} {solve_time:10.2f} {enumeration:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,73 @@
+"""Benchmark of the optimizer backends: CBC model vs. exhaustive enumeration.
+
+Solves the same random constraint sets with both backends, checks that the optimal objective
+values agree and reports the time per solve.
+
+    python -m benchmarks.bench_optimizer_backends [n_problems]
+"""
+import sys
+import time
+
+import numpy as np
+
+from maestro_pizza_maker.pizza_optimizer import (
+    PizzaConstraintsIngredients,
+    PizzaConstraintsValues,
+    PizzaOptimizer,
+    ValueBounds,
+    count_candidate_pizzas,
+)
+
+
+def random_problems(n_problems: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_problems):
+        constraints_ingredients = PizzaConstraintsIngredients(
+            cheese=int(rng.integers(0, 4)),
+            fruits=int(rng.integers(0, 3)),
+            meat=int(rng.integers(0, 4)),
+            vegetables=int(rng.integers(0, 4)),
+        )
+        calories_min = float(rng.uniform(0, 1500))
+        constraints_values = PizzaConstraintsValues(
+            calories=ValueBounds(min=calories_min, max=calories_min + float(rng.uniform(200, 2000))),
+            protein=ValueBounds(min=float(rng.uniform(0, 20))),
+        )
+        yield constraints_values, constraints_ingredients, float(rng.uniform(0, 5))
+
+
+def solve_all(optimizer: PizzaOptimizer, problems) -> list:
+    objectives = []
+    for constraints_values, constraints_ingredients, lambda_param in problems:
+        try:
+            pizza = optimizer.maximize_taste_penalty_price(
+                constraints_values, constraints_ingredients, lambda_param
+            )
+            objectives.append(pizza.taste.mean() - lambda_param * pizza.price)
+        except Exception:
+            objectives.append(None)
+    return objectives
+
+
+def main(n_problems: int = 200) -> None:
+    problems = list(random_problems(n_problems))
+    sizes = [count_candidate_pizzas(problem[1]) for problem in problems]
+    print(f"{n_problems} problems, {min(sizes)}-{max(sizes)} candidate pizzas each")
+    results = {}
+    for backend in ["mip", "enumeration"]:
+        optimizer = PizzaOptimizer(backend=backend)
+        start = time.perf_counter()
+        results[backend] = solve_all(optimizer, problems)
+        elapsed = time.perf_counter() - start
+        print(f"{backend:>12}: {1000 * elapsed / n_problems:8.3f} ms per solve")
+    mismatches = [
+        (mip, enumeration)
+        for mip, enumeration in zip(results["mip"], results["enumeration"])
+        if (mip is None) != (enumeration is None)
+        or (mip is not None and not np.isclose(mip, enumeration))
+    ]
+    print(f"objective mismatches: {len(mismatches)}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,70 @@
+"""Convergence benchmark of the variance reduction modes of the taste risk estimates.
+
+Estimates the CTaR of a pizza many times with every simulation method and sample size and
+reports the root mean squared error against a large plain Monte Carlo reference, and the
+efficiency (MSE of plain Monte Carlo / MSE of the method, i.e. how many times fewer scenarios
+the method needs for the same precision).
+
+    python -m benchmarks.bench_variance_reduction [quantile] [n_replications]
+"""
+import sys
+import time
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import PizzaIngredients
+from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.taste_at_risk import (
+    SIMULATION_METHODS,
+    simulated_taste_risk,
+    taste_risk,
+    taste_weights,
+)
+
+SAMPLE_SIZES = (1_000, 4_000, 16_000)
+REFERENCE_SCENARIOS = 4_000_000
+
+
+def reference_risk(pizza: Pizza, quantile: float, seed: int = 12345) -> float:
+    # CTaR of plain Monte Carlo with REFERENCE_SCENARIOS drawings, taste computed chunk by chunk
+    distribution = pizza.catalog.fat_distribution()
+    weights = taste_weights(pizza)
+    rng = np.random.default_rng(seed)
+    taste = np.concatenate(
+        [weights @ distribution.sample(200_000, rng) for _ in range(REFERENCE_SCENARIOS // 200_000)]
+    )
+    return float(taste_risk(taste, [quantile])[1][0, 0])
+
+
+def main(quantile: float = 0.01, n_replications: int = 100) -> None:
+    pizza = Pizza(
+        dough=PizzaIngredients.THIN_DOUGH,
+        sauce=PizzaIngredients.TOMATO_SAUCE,
+        cheese=[PizzaIngredients.MOZZARELA],
+        meat=[PizzaIngredients.HAM, PizzaIngredients.BACON],
+        vegetables=[PizzaIngredients.ONIONS],
+    )
+    reference = reference_risk(pizza, quantile)
+    print(f"{pizza.name}, CTaR at {quantile:.0%} (reference {reference:.4f}), {n_replications} replications")
+    print(f"{'method':>11} {'scenarios':>10} {'rmse':>10} {'efficiency':>11} {'ms/estimate':>12}")
+    for n_scenarios in SAMPLE_SIZES:
+        mse_mc = None
+        for method in SIMULATION_METHODS:
+            start = time.perf_counter()
+            estimates = np.array(
+                [
+                    simulated_taste_risk(pizza, [quantile], n_scenarios, method, seed=seed)[1][0]
+                    for seed in range(n_replications)
+                ]
+            )
+            elapsed = 1000 * (time.perf_counter() - start) / n_replications
+            mse = float(np.mean((estimates - reference) ** 2))
+            mse_mc = mse if method == "mc" else mse_mc
+            print(
+                f"{method:>11} {n_scenarios:>10} {np.sqrt(mse):10.4f} {mse_mc / mse:11.2f} {elapsed:12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    main(*(convert(argument) for convert, argument in zip((float, int), arguments)))
@@ -1 +1,33 @@
 __version__ = "202304.1001"
+
+import importlib
+
+# public names are resolved lazily, so that importing the package (or only the pizza
+# arithmetic) does not pull in pandas, scikit-learn or mip and the CBC library
+_LAZY_EXPORTS = {
+    "IngredientType": "maestro_pizza_maker.ingredients",
+    "PizzaIngredient": "maestro_pizza_maker.ingredients",
+    "PizzaIngredients": "maestro_pizza_maker.ingredients",
+    "IngredientCatalog": "maestro_pizza_maker.ingredients",
+    "INGREDIENT_CATALOG": "maestro_pizza_maker.ingredients",
+    "Pizza": "maestro_pizza_maker.pizza",
+    "CompactPizza": "maestro_pizza_maker.pizza",
+    "PizzaMenu": "maestro_pizza_maker.pizza_menu",
+    "PizzaMenuBatch": "maestro_pizza_maker.pizza_menu",
+    "ValueBounds": "maestro_pizza_maker.pizza_optimizer",
+    "PizzaConstraintsValues": "maestro_pizza_maker.pizza_optimizer",
+    "PizzaConstraintsIngredients": "maestro_pizza_maker.pizza_optimizer",
+    "minimize_price": "maestro_pizza_maker.pizza_optimizer",
+    "maximize_taste_penalty_price": "maestro_pizza_maker.pizza_optimizer",
+    "OptimizerCache": "maestro_pizza_maker.optimizer_cache",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        return getattr(importlib.import_module(_LAZY_EXPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
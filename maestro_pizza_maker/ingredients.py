@@ -1,10 +1,18 @@
 # class representing a pizza ingredient
 
+import csv
 from dataclasses import dataclass
+import hashlib
 from enum import Enum
-from typing import Dict, Literal, Union
-import pandas as pd
-from maestro_pizza_maker.sand_box.fat_generator import FAT_SIMULATIONS
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Literal, Optional, Sequence, Union
+from maestro_pizza_maker.sand_box.fat_generator import (
+    DATA_DIR,
+    FAT_SCENARIO_STORE,
+    FatDistribution,
+    FatScenarioStore,
+    fat_simulations,
+)
 
 # from numpy.random import normal, exponential, gamma, uniform
 import numpy as np
@@ -25,10 +33,16 @@ class PizzaIngredient:
     price: float
     type: IngredientType
     protein: float
-    fat: np.array
+    # row of the fat scenarios holding the drawings from the fat distribution of the ingredient
+    fat_scenario: int
     carbohydrates: float
     calories: float
 
+    @property
+    def fat(self) -> np.array:
+        # loaded lazily from the (memory-mapped) fat scenario store
+        return fat_simulations()[self.fat_scenario]
+
 
 # enum representing pizza ingredients
 
@@ -39,7 +53,7 @@ class PizzaIngredients(Enum):
         price=0.5,
         type=IngredientType.SAUCE,
         protein=0.5,
-        fat=FAT_SIMULATIONS[0],
+        fat_scenario=0,
         carbohydrates=3.0,
         calories=20.0,
     )
@@ -48,7 +62,7 @@ class PizzaIngredients(Enum):
         price=0.6,
         type=IngredientType.SAUCE,
         protein=0.6,
-        fat=FAT_SIMULATIONS[1],
+        fat_scenario=1,
         carbohydrates=4.0,
         calories=30.0,
     )
@@ -57,7 +71,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.CHEESE,
         protein=10.0,
-        fat=FAT_SIMULATIONS[2],
+        fat_scenario=2,
         carbohydrates=0.0,
         calories=400.0,
     )
@@ -66,7 +80,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.CHEESE,
         protein=10.0,
-        fat=FAT_SIMULATIONS[3],
+        fat_scenario=3,
         carbohydrates=0.0,
         calories=400.0,
     )
@@ -75,7 +89,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.CHEESE,
         protein=10.0,
-        fat=FAT_SIMULATIONS[4],
+        fat_scenario=4,
         carbohydrates=0.0,
         calories=400.0,
     )
@@ -84,7 +98,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.MEAT,
         protein=10.0,
-        fat=FAT_SIMULATIONS[5],
+        fat_scenario=5,
         carbohydrates=0.0,
         calories=400.0,
     )
@@ -93,7 +107,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.MEAT,
         protein=10.0,
-        fat=FAT_SIMULATIONS[6],
+        fat_scenario=6,
         carbohydrates=0.0,
         calories=400.0,
     )
@@ -102,7 +116,7 @@ class PizzaIngredients(Enum):
         price=2.0,
         type=IngredientType.MEAT,
         protein=20.0,
-        fat=FAT_SIMULATIONS[7],
+        fat_scenario=7,
         carbohydrates=0.0,
         calories=800.0,
     )
@@ -111,7 +125,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.VEGETABLE,
         protein=5.0,
-        fat=FAT_SIMULATIONS[8],
+        fat_scenario=8,
         carbohydrates=5.0,
         calories=50.0,
     )
@@ -120,7 +134,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.VEGETABLE,
         protein=5.0,
-        fat=FAT_SIMULATIONS[9],
+        fat_scenario=9,
         carbohydrates=5.0,
         calories=50.0,
     )
@@ -129,7 +143,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.VEGETABLE,
         protein=5.0,
-        fat=FAT_SIMULATIONS[10],
+        fat_scenario=10,
         carbohydrates=5.0,
         calories=50.0,
     )
@@ -138,7 +152,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.FRUIT,
         protein=5.0,
-        fat=FAT_SIMULATIONS[11],
+        fat_scenario=11,
         carbohydrates=5.0,
         calories=50.0,
     )
@@ -147,7 +161,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.FRUIT,
         protein=5.0,
-        fat=FAT_SIMULATIONS[12],
+        fat_scenario=12,
         carbohydrates=5.0,
         calories=50.0,
     )
@@ -156,7 +170,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.DOUGH,
         protein=10.0,
-        fat=FAT_SIMULATIONS[13],
+        fat_scenario=13,
         carbohydrates=10.0,
         calories=100.0,
     )
@@ -165,7 +179,7 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.DOUGH,
         protein=10.0,
-        fat=FAT_SIMULATIONS[14],
+        fat_scenario=14,
         carbohydrates=10.0,
         calories=100.0,
     )
@@ -174,14 +188,20 @@ class PizzaIngredients(Enum):
         price=1.0,
         type=IngredientType.DOUGH,
         protein=10.0,
-        fat=FAT_SIMULATIONS[15],
+        fat_scenario=15,
         carbohydrates=10.0,
         calories=100.0,
     )
 
+    @property
+    def catalog(self) -> "IngredientCatalog":
+        return INGREDIENT_CATALOG
+
     # create a dataframes with all ingredients
     @staticmethod
     def get_ingredients_df():
+        import pandas as pd
+
         ingredients = []
         for ingredient in PizzaIngredients:
             ingredients.append(
@@ -196,3 +216,380 @@ class PizzaIngredients(Enum):
                 }
             )
         return pd.DataFrame(ingredients)
+
+
+# taste weights of the ingredient types, taste = sum(weight(type) * fat) over the ingredients
+TASTE_WEIGHTS: Dict[str, float] = {
+    "DOUGH": 0.05,
+    "SAUCE": 0.2,
+    "CHEESE": 0.3,
+    "FRUIT": 0.1,
+    "MEAT": 0.3,
+    "VEGETABLE": 0.05,
+}
+
+# deterministic nutrient columns of the ingredient catalog
+NUTRIENTS = ("price", "protein", "carbohydrates", "calories")
+
+
+# columnar store of the pizza ingredients
+
+# columns of the catalog data files, the nutrients in NUTRIENTS order
+CATALOG_COLUMNS = ("key", "name", "type") + NUTRIENTS + ("fat_scenario",)
+
+DEFAULT_CATALOG_PATH = DATA_DIR / "ingredients.csv"
+
+
+class IngredientRecord:
+    # properties of one catalog row, the counterpart of PizzaIngredient for loaded catalogs
+    __slots__ = ("catalog", "row")
+
+    def __init__(self, catalog: "IngredientCatalog", row: int) -> None:
+        self.catalog = catalog
+        self.row = row
+
+    @property
+    def name(self) -> str:
+        return self.catalog.names[self.row]
+
+    @property
+    def type(self) -> IngredientType:
+        return self.catalog.types[self.row]
+
+    @property
+    def price(self) -> float:
+        return float(self.catalog.nutrients[self.row, 0])
+
+    @property
+    def protein(self) -> float:
+        return float(self.catalog.nutrients[self.row, 1])
+
+    @property
+    def carbohydrates(self) -> float:
+        return float(self.catalog.nutrients[self.row, 2])
+
+    @property
+    def calories(self) -> float:
+        return float(self.catalog.nutrients[self.row, 3])
+
+    @property
+    def fat(self) -> np.ndarray:
+        return self.catalog.fat[self.row]
+
+
+class CatalogIngredient:
+    """
+    Handle of an ingredient of a loaded catalog.
+
+    Duck-typed like a PizzaIngredients member: `name` is the key of the ingredient and
+    `value` its properties, so pizzas can be built from either of them.
+    """
+
+    __slots__ = ("catalog", "row")
+
+    def __init__(self, catalog: "IngredientCatalog", row: int) -> None:
+        self.catalog = catalog
+        self.row = row
+
+    @property
+    def name(self) -> str:
+        return self.catalog.keys[self.row]
+
+    @property
+    def value(self) -> IngredientRecord:
+        return IngredientRecord(self.catalog, self.row)
+
+    def __repr__(self) -> str:
+        return f"<CatalogIngredient.{self.name}>"
+
+    def __reduce__(self):
+        return (_catalog_ingredient, (self.catalog, self.row))
+
+
+def _catalog_ingredient(catalog: "IngredientCatalog", row: int) -> CatalogIngredient:
+    # unpickled handles are the ones of the (unpickled) catalog, so identity comparisons hold
+    return catalog.ingredients[row]
+
+
+# an ingredient of a pizza: a member of the built-in enum or a handle of a loaded catalog
+Ingredient = Union[PizzaIngredients, CatalogIngredient]
+
+
+class IngredientCatalog:
+    """
+    Precomputed columnar view of a set of pizza ingredients.
+
+    Row i of every matrix belongs to ingredients[i], so a pizza is fully described by
+    a composition vector holding the count of every ingredient and each of its properties
+    is a single dot product (or a matmul for a whole stack of compositions).
+
+    Built either from PizzaIngredients members or from columns (see `from_columns` and
+    `load_catalog`), in which case the ingredients are CatalogIngredient handles.
+    """
+
+    def __init__(self, ingredients: Sequence[PizzaIngredients]) -> None:
+        ingredients = tuple(ingredients)
+        self._set_columns(
+            ingredients,
+            keys=[ingredient.name for ingredient in ingredients],
+            names=[ingredient.value.name for ingredient in ingredients],
+            types=[ingredient.value.type for ingredient in ingredients],
+            nutrients=[
+                [getattr(ingredient.value, nutrient) for nutrient in NUTRIENTS]
+                for ingredient in ingredients
+            ],
+            fat_scenarios=[ingredient.value.fat_scenario for ingredient in ingredients],
+            fat=None,
+        )
+
+    @classmethod
+    def from_columns(
+        cls,
+        keys: Sequence[str],
+        types: Sequence[Union[IngredientType, str]],
+        nutrients: np.ndarray,
+        names: Optional[Sequence[str]] = None,
+        fat_scenarios: Optional[Sequence[int]] = None,
+        fat: Optional[np.ndarray] = None,
+    ) -> "IngredientCatalog":
+        """
+        Catalog of arbitrary size from its columns.
+
+        `nutrients` is (n_ingredients x 4) in NUTRIENTS order. The fat drawings are either given
+        as an (n_ingredients x n_simulations) `fat` matrix or as rows `fat_scenarios` of the fat
+        scenario store (default: one row per ingredient, in order).
+        """
+        catalog = cls.__new__(cls)
+        n_ingredients = len(keys)
+        catalog._set_columns(
+            None,
+            keys=keys,
+            names=keys if names is None else names,
+            types=[_ingredient_type(type) for type in types],
+            nutrients=np.asarray(nutrients, dtype=float).reshape(n_ingredients, len(NUTRIENTS)),
+            fat_scenarios=np.arange(n_ingredients) if fat_scenarios is None else fat_scenarios,
+            fat=fat,
+        )
+        return catalog
+
+    def _set_columns(
+        self, ingredients, keys, names, types, nutrients, fat_scenarios, fat
+    ) -> None:
+        self.keys = tuple(keys)
+        self.names = tuple(names)
+        self.types = tuple(types)
+        # (n_ingredients x n_nutrients) matrix, columns ordered as NUTRIENTS
+        self.nutrients = np.array(nutrients, dtype=float).reshape(len(self.keys), len(NUTRIENTS))
+        self.fat_scenarios = np.asarray(fat_scenarios, dtype=int)
+        # handles are rebuilt (not pickled) with the catalog, see __reduce__
+        self._handles = ingredients is None
+        if ingredients is None:
+            ingredients = tuple(CatalogIngredient(self, row) for row in range(len(self.keys)))
+        self.ingredients = ingredients
+        self.index = {ingredient: i for i, ingredient in enumerate(self.ingredients)}
+        # O(1) lookup of the rows by key (and by display name where it is unambiguous)
+        self.name_index: Dict[str, int] = {}
+        for i, name in enumerate(self.names):
+            self.name_index.setdefault(name, i)
+        self.name_index.update({key: i for i, key in enumerate(self.keys)})
+        self._fat = None if fat is None else np.asarray(fat, dtype=float)
+        self._explicit_fat = fat is not None
+        self._average_fat = None
+        self._fingerprint = None
+        # taste weight of every ingredient given by its type
+        self.weights = np.array([TASTE_WEIGHTS[type.name] for type in self.types])
+
+    def __len__(self) -> int:
+        return len(self.ingredients)
+
+    def __getitem__(self, name: str) -> Ingredient:
+        return self.ingredients[self.name_index[name]]
+
+    def __reduce__(self):
+        # the built-in catalog is pickled by reference, worker processes use their own copy
+        if self is INGREDIENT_CATALOG:
+            return "INGREDIENT_CATALOG"
+        # the columns only: the CatalogIngredient handles are rebuilt and fat drawings that come
+        # from the scenario store are loaded (memory-mapped) again by the receiving process
+        return (
+            _restore_catalog,
+            (
+                None if self._handles else self.ingredients,
+                self.keys,
+                self.names,
+                self.types,
+                self.nutrients,
+                self.fat_scenarios,
+                self._fat if self._explicit_fat else None,
+                self._fingerprint,
+            ),
+        )
+
+    def ingredients_of_type(self, ingredient_type: IngredientType) -> List[Ingredient]:
+        return [
+            ingredient for ingredient, type in zip(self.ingredients, self.types) if type == ingredient_type
+        ]
+
+    def _fat_store(self) -> FatScenarioStore:
+        # the default store, or one of the size of the catalog if it has more ingredients
+        dim = int(self.fat_scenarios.max()) + 1 if len(self.fat_scenarios) else 0
+        if dim <= FAT_SCENARIO_STORE.dim:
+            return FAT_SCENARIO_STORE
+        return FatScenarioStore(dim=dim)
+
+    def fat_distribution(self) -> FatDistribution:
+        # multivariate normal distribution (before clipping) the fat drawings of the catalog come from
+        if self._explicit_fat:
+            raise ValueError(
+                "The fat drawings of the catalog were given explicitly, there is no distribution"
+            )
+        distribution = self._fat_store().distribution()
+        rows = self.fat_scenarios
+        return FatDistribution(
+            mean=distribution.mean[rows],
+            cov=distribution.cov[np.ix_(rows, rows)],
+            clip_min=distribution.clip_min,
+        )
+
+    @property
+    def fat(self) -> np.ndarray:
+        # (n_ingredients x n_simulations) matrix of the fat drawings, loaded on first use;
+        # zero-copy view of the scenario store when the rows are already in catalog order
+        if self._fat is None:
+            store = self._fat_store()
+            simulations = fat_simulations() if store is FAT_SCENARIO_STORE else store.load()
+            if np.array_equal(self.fat_scenarios, np.arange(len(simulations))):
+                self._fat = simulations
+            else:
+                self._fat = np.asarray(simulations[self.fat_scenarios])
+        return self._fat
+
+    @property
+    def average_fat(self) -> np.ndarray:
+        if self._average_fat is None:
+            self._average_fat = self.fat.mean(axis=1)
+        return self._average_fat
+
+    @property
+    def fingerprint(self) -> str:
+        # digest of everything the optimizers and the pizzas read from the catalog: the
+        # ingredients, their display names, types, nutrients, taste weights and fat drawings;
+        # a changed catalog has a different fingerprint
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            digest.update(repr(list(self.keys)).encode())
+            digest.update(repr(list(self.names)).encode())
+            digest.update(repr([type.value for type in self.types]).encode())
+            for array in (self.nutrients, self.weights, self.fat):
+                digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def composition(self, ingredients: Iterable[Ingredient]) -> np.ndarray:
+        # count vector of the given ingredients
+        composition = np.zeros(len(self.ingredients))
+        for ingredient in ingredients:
+            composition[self.index[ingredient]] += 1
+        return composition
+
+    def nutrient(self, composition: np.ndarray, nutrient: str) -> Union[float, np.ndarray]:
+        return composition @ self.nutrients[:, NUTRIENTS.index(nutrient)]
+
+    def fat_samples(self, composition: np.ndarray) -> np.ndarray:
+        return composition @ self.fat
+
+    def mean_fat(self, composition: np.ndarray) -> Union[float, np.ndarray]:
+        return composition @ self.average_fat
+
+    def taste(self, composition: np.ndarray) -> np.ndarray:
+        return (composition * self.weights) @ self.fat
+
+    def fat_chunks(self, chunk_size: int) -> Iterator[np.ndarray]:
+        # (n_ingredients x chunk_size) views of the fat drawings, for streaming consumers
+        for start in range(0, self.fat.shape[1], chunk_size):
+            yield self.fat[:, start : start + chunk_size]
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        # the catalog as CATALOG_COLUMNS arrays, the layout of the data files
+        columns = {
+            "key": np.array(self.keys),
+            "name": np.array(self.names),
+            "type": np.array([type.value for type in self.types]),
+        }
+        columns.update({nutrient: self.nutrients[:, i] for i, nutrient in enumerate(NUTRIENTS)})
+        columns["fat_scenario"] = self.fat_scenarios
+        return columns
+
+
+def _restore_catalog(
+    ingredients, keys, names, types, nutrients, fat_scenarios, fat, fingerprint
+) -> IngredientCatalog:
+    catalog = IngredientCatalog.__new__(IngredientCatalog)
+    catalog._set_columns(ingredients, keys, names, types, nutrients, fat_scenarios, fat)
+    catalog._fingerprint = fingerprint
+    return catalog
+
+
+def _ingredient_type(type: Union[IngredientType, str]) -> IngredientType:
+    # accepts the members and their values ("cheese") or names ("CHEESE")
+    if isinstance(type, IngredientType):
+        return type
+    type = str(type).strip()
+    return IngredientType[type] if type in IngredientType.__members__ else IngredientType(type.lower())
+
+
+def load_catalog(
+    path: Union[str, Path] = DEFAULT_CATALOG_PATH, fat: Optional[np.ndarray] = None
+) -> IngredientCatalog:
+    """
+    Loads a catalog from a .csv, .npz or .parquet file with the CATALOG_COLUMNS.
+
+    "name" and "fat_scenario" are optional. An .npz file can carry the fat drawings as an
+    (n_ingredients x n_simulations) "fat" array, `fat` overrides them.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        with open(path, newline="") as file:
+            rows = list(csv.DictReader(file))
+        columns = {column: [row[column] for row in rows] for column in (rows[0] if rows else CATALOG_COLUMNS)}
+    elif suffix == ".npz":
+        with np.load(path, allow_pickle=False) as data:
+            columns = {column: data[column] for column in data.files}
+    elif suffix == ".parquet":
+        import pandas as pd
+
+        frame = pd.read_parquet(path)
+        columns = {column: frame[column].to_numpy() for column in frame.columns}
+    else:
+        raise ValueError(f"Unsupported catalog file {path}, use .csv, .npz or .parquet")
+    return IngredientCatalog.from_columns(
+        keys=[str(key) for key in columns["key"]],
+        names=[str(name) for name in columns["name"]] if "name" in columns else None,
+        types=columns["type"],
+        nutrients=np.column_stack([np.asarray(columns[nutrient], dtype=float) for nutrient in NUTRIENTS]),
+        fat_scenarios=np.asarray(columns["fat_scenario"], dtype=int) if "fat_scenario" in columns else None,
+        fat=fat if fat is not None else columns.get("fat"),
+    )
+
+
+def save_catalog(catalog: IngredientCatalog, path: Union[str, Path], include_fat: bool = False) -> Path:
+    # writes the catalog as .csv or .npz (optionally with its fat drawings), see load_catalog
+    path = Path(path)
+    columns = catalog.columns()
+    if path.suffix.lower() == ".npz":
+        if include_fat:
+            columns["fat"] = np.asarray(catalog.fat)
+        np.savez(path, **columns)
+    elif path.suffix.lower() == ".csv":
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CATALOG_COLUMNS)
+            for row in zip(*(columns[column] for column in CATALOG_COLUMNS)):
+                writer.writerow([value.item() if hasattr(value, "item") else value for value in row])
+    else:
+        raise ValueError(f"Unsupported catalog file {path}, use .csv or .npz")
+    return path
+
+
+INGREDIENT_CATALOG = IngredientCatalog(PizzaIngredients)
@@ -0,0 +1,211 @@
+# Memoization of the optimizer results. The same constraints keep coming back and every repeated
+# request would otherwise run the solver again. Results are kept as CompactPizza codes (a single
+# int), infeasible requests are cached as well. The keys contain the catalog fingerprint, so the
+# entries computed for other ingredients or other fat scenarios are never served.
+
+from collections import OrderedDict
+from dataclasses import astuple, dataclass
+from pathlib import Path
+from typing import Hashable, Optional, Tuple, Union
+
+from maestro_pizza_maker.pizza import CompactPizza, Pizza
+from maestro_pizza_maker.pizza_optimizer import (
+    InfeasiblePizzaError,
+    PizzaConstraintsIngredients,
+    PizzaConstraintsValues,
+    PizzaOptimizer,
+    default_optimizer,
+)
+
+# cached value of the requests without any feasible pizza
+_INFEASIBLE = -1
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+def _canonical(value) -> Tuple:
+    # dataclasses -> nested tuples of floats, so that 1, 1.0 and np.float64(1.0) (and the
+    # np.inf bounds) give the same key and the key has a stable repr for the disk cache
+    if isinstance(value, tuple):
+        return tuple(_canonical(item) for item in value)
+    if isinstance(value, str):
+        return value
+    return float(value)
+
+
+class OptimizerCache:
+    """
+    LRU cache in front of a PizzaOptimizer.
+
+    Holds at most `maxsize` results in memory. With a `path` the results are also stored in a
+    sqlite file, shared by the processes and surviving restarts; misses of the memory cache are
+    looked up there before solving.
+    """
+
+    def __init__(
+        self,
+        optimizer: Optional[PizzaOptimizer] = None,
+        maxsize: int = 4096,
+        path: Optional[Union[str, Path]] = None,
+    ) -> None:
+        self.optimizer = optimizer
+        self.maxsize = maxsize
+        self.path = Path(path) if path is not None else None
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._fingerprint: Optional[str] = None
+        self._connection = None
+
+    def _optimizer(self) -> PizzaOptimizer:
+        return self.optimizer if self.optimizer is not None else default_optimizer()
+
+    def _db(self):
+        if self._connection is None:
+            import sqlite3
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, code INTEGER NOT NULL)"
+            )
+        return self._connection
+
+    def _key(self, objective: str, *arguments) -> Tuple:
+        fingerprint = self._optimizer().catalog.fingerprint
+        if fingerprint != self._fingerprint:
+            # another catalog or other fat scenarios -> none of the entries is valid anymore
+            self._entries.clear()
+            self._fingerprint = fingerprint
+        return (fingerprint, objective) + _canonical(arguments)
+
+    def _get(self, key: Tuple) -> Optional[int]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.path is not None:
+            row = self._db().execute("SELECT code FROM results WHERE key = ?", (repr(key),)).fetchone()
+            if row is not None:
+                self._put(key, row[0], persist=False)
+                return row[0]
+        return None
+
+    def _put(self, key: Tuple, code: int, persist: bool = True) -> None:
+        self._entries[key] = code
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        self.stats.size = len(self._entries)
+        if persist and self.path is not None:
+            with self._db() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results (key, code) VALUES (?, ?)", (repr(key), code)
+                )
+
+    def _cached(self, key: Tuple, solve) -> Pizza:
+        code = self._get(key)
+        if code is None:
+            self.stats.misses += 1
+            try:
+                code = solve().compact.code
+            except InfeasiblePizzaError:
+                code = _INFEASIBLE
+            self._put(key, code)
+        else:
+            self.stats.hits += 1
+        if code == _INFEASIBLE:
+            raise InfeasiblePizzaError(
+                "The model is not optimal -> likely no solution found (infeasible))"
+            )
+        # a fresh Pizza for every call, the callers may modify it
+        return CompactPizza(code, self._optimizer().catalog).to_pizza()
+
+    def minimize_price(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        backend: Optional[str] = None,
+    ) -> Pizza:
+        key = self._key(
+            "minimize_price", astuple(constraints_values), astuple(constraints_ingredients)
+        )
+        return self._cached(
+            key,
+            lambda: self._optimizer().minimize_price(
+                constraints_values, constraints_ingredients, backend=backend
+            ),
+        )
+
+    def maximize_taste_penalty_price(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        lambda_param: float = 0.5,
+        backend: Optional[str] = None,
+    ) -> Pizza:
+        key = self._key(
+            "maximize_taste_penalty_price",
+            astuple(constraints_values),
+            astuple(constraints_ingredients),
+            lambda_param,
+        )
+        return self._cached(
+            key,
+            lambda: self._optimizer().maximize_taste_penalty_price(
+                constraints_values, constraints_ingredients, lambda_param, backend=backend
+            ),
+        )
+
+    def clear(self) -> None:
+        # drops the memory and the disk entries and resets the statistics
+        self._entries.clear()
+        self.stats = CacheStats()
+        if self.path is not None:
+            with self._db() as connection:
+                connection.execute("DELETE FROM results")
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_default_cache: Optional[OptimizerCache] = None
+
+
+def default_cache() -> OptimizerCache:
+    # in-memory cache in front of the default optimizer, built on first use
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OptimizerCache()
+    return _default_cache
+
+
+def cached_minimize_price(
+    constraints_values: PizzaConstraintsValues,
+    constraints_ingredients: PizzaConstraintsIngredients,
+    backend: Optional[str] = None,
+) -> Pizza:
+    return default_cache().minimize_price(constraints_values, constraints_ingredients, backend)
+
+
+def cached_maximize_taste_penalty_price(
+    constraints_values: PizzaConstraintsValues,
+    constraints_ingredients: PizzaConstraintsIngredients,
+    lambda_param: float = 0.5,
+    backend: Optional[str] = None,
+) -> Pizza:
+    return default_cache().maximize_taste_penalty_price(
+        constraints_values, constraints_ingredients, lambda_param, backend
+    )
@@ -1,58 +1,40 @@
 # class representing a pizza
 
 from dataclasses import dataclass
-from typing import List, Literal, Optional
+from typing import Callable, List, Optional, Tuple
 
-from maestro_pizza_maker.ingredients import PizzaIngredients
+from maestro_pizza_maker.ingredients import (
+    INGREDIENT_CATALOG,
+    TASTE_WEIGHTS,
+    Ingredient,
+    IngredientCatalog,
+    IngredientType,
+)
 import numpy as np
 
+# pizza fields holding the ingredients of the respective types, in the canonical order
+PIZZA_FIELDS = {
+    IngredientType.DOUGH: "dough",
+    IngredientType.SAUCE: "sauce",
+    IngredientType.CHEESE: "cheese",
+    IngredientType.FRUIT: "fruits",
+    IngredientType.MEAT: "meat",
+    IngredientType.VEGETABLE: "vegetables",
+}
+
 
 @dataclass
 class Pizza:
-    dough: Literal[
-        PizzaIngredients.CLASSIC_DOUGH,
-        PizzaIngredients.THIN_DOUGH,
-        PizzaIngredients.WHOLEMEAL_DOUGH,
-    ]
-    sauce: Literal[PizzaIngredients.TOMATO_SAUCE, PizzaIngredients.CREAM_SAUCE]
-    cheese: Optional[
-        List[
-            Literal[
-                PizzaIngredients.MOZZARELA,
-                PizzaIngredients.CHEDDAR,
-                PizzaIngredients.PARMESAN,
-            ]
-        ]
-    ] = None
-    fruits: Optional[
-        List[Literal[PizzaIngredients.PINEAPPLE, PizzaIngredients.APPLE]]
-    ] = None
-    meat: Optional[
-        List[
-            Literal[
-                PizzaIngredients.HAM, PizzaIngredients.BACON, PizzaIngredients.SAUSAGE
-            ]
-        ]
-    ] = None
-    vegetables: Optional[
-        List[
-            Literal[
-                PizzaIngredients.MUSHROOMS,
-                PizzaIngredients.ONIONS,
-                PizzaIngredients.PEPPER,
-            ]
-        ]
-    ] = None
-
-    weights = {
-            'DOUGH': 0.05,
-            'SAUCE': 0.2,
-            'CHEESE': 0.3,
-            'FRUIT': 0.1,
-            'MEAT': 0.3,
-            'VEGETABLE': 0.05
-        }
-    
+    # members of PizzaIngredients or handles of a loaded IngredientCatalog, all of one catalog
+    dough: Ingredient
+    sauce: Ingredient
+    cheese: Optional[List[Ingredient]] = None
+    fruits: Optional[List[Ingredient]] = None
+    meat: Optional[List[Ingredient]] = None
+    vegetables: Optional[List[Ingredient]] = None
+
+    weights = TASTE_WEIGHTS
+
     def __post_init__(self) -> None:
         if self.cheese is None:
             self.cheese = []
@@ -62,7 +44,43 @@ class Pizza:
             self.meat = []
         if self.vegetables is None:
             self.vegetables = []
-        self.ingredients = [
+        # derived quantities memoized until the ingredients change, see `_cached`
+        self._cache_key: Optional[Tuple] = None
+        self._cache: dict = {}
+
+    def _ingredients_key(self) -> Tuple:
+        return (
+            self.dough,
+            self.sauce,
+            tuple(self.cheese),
+            tuple(self.fruits),
+            tuple(self.meat),
+            tuple(self.vegetables),
+        )
+
+    def _cached(self, name: str, compute: Callable):
+        # the ingredient lists are mutable, so the cache is keyed on their current content
+        # and dropped as soon as any of them is reassigned or modified in place
+        key = self._ingredients_key()
+        if key != self._cache_key:
+            self._cache_key = key
+            self._cache = {}
+        if name not in self._cache:
+            value = compute()
+            if isinstance(value, np.ndarray):
+                # cached arrays are shared between callers, protect them from in-place changes
+                value.flags.writeable = False
+            self._cache[name] = value
+        return self._cache[name]
+
+    @property
+    def catalog(self) -> IngredientCatalog:
+        # the catalog the ingredients belong to
+        return self.dough.catalog
+
+    @property
+    def ingredients(self) -> List[Ingredient]:
+        return [
             self.dough,
             self.sauce,
             *self.cheese,
@@ -71,32 +89,41 @@ class Pizza:
             *self.vegetables,
         ]
 
+    @property
+    def composition(self) -> np.ndarray:
+        # count vector of the ingredients w.r.t. the rows of the ingredient catalog
+        return self._cached(
+            "composition", lambda: self.catalog.composition(self.ingredients)
+        )
+
     @property
     def price(self) -> float:
-        return sum(ingredient.value.price for ingredient in self.ingredients)
+        return self.catalog.nutrient(self.composition, "price")
 
     @property
     def protein(self) -> float:
-        return sum(ingredient.value.protein for ingredient in self.ingredients)
+        return self.catalog.nutrient(self.composition, "protein")
 
     @property
     def fat(self) -> np.array:
-        return sum(ingredient.value.fat for ingredient in self.ingredients)
+        return self._cached("fat", lambda: self.catalog.fat_samples(self.composition))
 
     @property
     def average_fat(self) -> float:
         # TODO: implement average fat calculation
         # HINT: check the `PizzaIngredients` class properly, you will find a `fat` property there which is a numpy array representing the drawings from the fat distribution
         # since fat is a random variable, we will calculate the average fat of the pizza by averaging the fat vectors of the ingredients
-        return sum(np.mean(ingredient.value.fat) for ingredient in self.ingredients)
+        return self._cached(
+            "average_fat", lambda: self.catalog.mean_fat(self.composition)
+        )
          
     @property
     def carbohydrates(self) -> float:
-        return sum(ingredient.value.carbohydrates for ingredient in self.ingredients)
+        return self.catalog.nutrient(self.composition, "carbohydrates")
 
     @property
     def calories(self) -> float:
-        return sum(ingredient.value.calories for ingredient in self.ingredients)
+        return self.catalog.nutrient(self.composition, "calories")
 
     @property
     def name(self) -> str:
@@ -104,7 +131,14 @@ class Pizza:
         # (you can use random, you can use some kind of algorithm) - just make sure that
         # the name is unique.
         #return "".join(ingredient.value.name for ingredient in self.ingredients)
-        return "Pizza"+str(id(self))
+        # canonical name derived from the composition -> identical pizzas share the name
+        return self.compact.name
+
+    @property
+    def compact(self) -> "CompactPizza":
+        return self._cached(
+            "compact", lambda: CompactPizza.from_composition(self.composition, self.catalog)
+        )
 
     @property
     def taste(self) -> np.array:
@@ -112,4 +146,102 @@ class Pizza:
         # The famous fact that taste is subjective is not true in this case. We believe that fat is the most important factor, since fat carries the most flavor.
         # So we will use the fat vector to calculate the taste of the pizza with the following formula:
         # taste = 0.05 * fat_dough + 0.2 * fat_sauce + 0.3 * fat_cheese + 0.1 * fat_fruits + 0.3 * fat_meat + 0.05 * fat_vegetables
-        return sum(ingredient.value.fat*self.weights[ingredient.value.type.name] for ingredient in self.ingredients)
+        return self._cached("taste", lambda: self.catalog.taste(self.composition))
+
+
+# compact, immutable and hashable representation of a pizza
+
+
+class CompactPizza:
+    """
+    Pizza encoded into a single integer.
+
+    Every ingredient of the catalog owns a nibble (4 bits) of `code` holding its count,
+    so hashing and equality are O(1), identical pizzas share one key and millions of
+    candidate pizzas fit into memory. Use `to_pizza` to get back a full `Pizza`.
+    Pizzas of different catalogs are never equal.
+    """
+
+    __slots__ = ("code", "catalog")
+
+    BITS_PER_INGREDIENT = 4
+    MAX_COUNT = 2**BITS_PER_INGREDIENT - 1
+
+    def __init__(self, code: int, catalog: IngredientCatalog = INGREDIENT_CATALOG) -> None:
+        object.__setattr__(self, "code", int(code))
+        object.__setattr__(self, "catalog", catalog)
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("CompactPizza is immutable")
+
+    def __reduce__(self):
+        return (CompactPizza, (self.code, self.catalog))
+
+    def __hash__(self) -> int:
+        return hash(self.code)
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, CompactPizza)
+            and self.code == other.code
+            and self.catalog is other.catalog
+        )
+
+    def __repr__(self) -> str:
+        return f"CompactPizza({self.name!r})"
+
+    @classmethod
+    def from_composition(
+        cls, composition: np.ndarray, catalog: IngredientCatalog = INGREDIENT_CATALOG
+    ) -> "CompactPizza":
+        code = 0
+        for i in np.flatnonzero(composition):
+            count = int(composition[i])
+            if count != composition[i] or not 0 < count <= cls.MAX_COUNT:
+                raise ValueError(
+                    f"Ingredient counts must be integers between 0 and {cls.MAX_COUNT}, got {composition[i]}"
+                )
+            code |= count << (cls.BITS_PER_INGREDIENT * int(i))
+        return cls(code, catalog)
+
+    @classmethod
+    def from_pizza(cls, pizza: Pizza) -> "CompactPizza":
+        return pizza.compact
+
+    @property
+    def composition(self) -> np.ndarray:
+        composition = np.zeros(len(self.catalog))
+        code, i = self.code, 0
+        while code:
+            composition[i] = code & self.MAX_COUNT
+            code >>= self.BITS_PER_INGREDIENT
+            i += 1
+        return composition
+
+    def _ingredients_by_field(self) -> dict:
+        ingredients = {field: [] for field in PIZZA_FIELDS.values()}
+        composition = self.composition
+        for i in np.flatnonzero(composition):
+            ingredient = self.catalog.ingredients[i]
+            ingredients[PIZZA_FIELDS[ingredient.value.type]] += [ingredient] * int(composition[i])
+        return ingredients
+
+    @property
+    def name(self) -> str:
+        ingredients = self._ingredients_by_field()
+        return "Pizza " + ", ".join(
+            ingredient.value.name for field in PIZZA_FIELDS.values() for ingredient in ingredients[field]
+        )
+
+    def to_pizza(self) -> Pizza:
+        ingredients = self._ingredients_by_field()
+        if len(ingredients["dough"]) != 1 or len(ingredients["sauce"]) != 1:
+            raise ValueError("A pizza needs exactly one dough and one sauce")
+        return Pizza(
+            dough=ingredients["dough"][0],
+            sauce=ingredients["sauce"][0],
+            cheese=ingredients["cheese"],
+            fruits=ingredients["fruits"],
+            meat=ingredients["meat"],
+            vegetables=ingredients["vegetables"],
+        )
@@ -1,19 +1,316 @@
 # class representing the pizza menu
 
 from dataclasses import dataclass
-from typing import List
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
-import pandas as pd
+import heapq
+import numpy as np
 import warnings
 
-from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.ingredients import INGREDIENT_CATALOG, IngredientCatalog
+from maestro_pizza_maker.pizza import CompactPizza, Pizza
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class PizzaMenuBatch:
+    """
+    Vectorized evaluation of many pizzas at once.
+
+    The pizzas are stacked into one (n_pizzas x n_ingredients) composition matrix, so every
+    property below is a single matmul against the ingredient catalog and returns one value
+    (or one row of samples) per pizza.
+    """
+
+    compositions: np.ndarray
+    catalog: IngredientCatalog = INGREDIENT_CATALOG
+
+    @property
+    def price(self) -> np.ndarray:
+        return self.catalog.nutrient(self.compositions, "price")
+
+    @property
+    def protein(self) -> np.ndarray:
+        return self.catalog.nutrient(self.compositions, "protein")
+
+    @property
+    def carbohydrates(self) -> np.ndarray:
+        return self.catalog.nutrient(self.compositions, "carbohydrates")
+
+    @property
+    def calories(self) -> np.ndarray:
+        return self.catalog.nutrient(self.compositions, "calories")
+
+    @property
+    def average_fat(self) -> np.ndarray:
+        return self.catalog.mean_fat(self.compositions)
+
+    @property
+    def fat(self) -> np.ndarray:
+        # (n_pizzas x n_simulations) matrix of the fat drawings
+        return self.catalog.fat_samples(self.compositions)
+
+    @property
+    def taste(self) -> np.ndarray:
+        # (n_pizzas x n_simulations) matrix of the taste drawings
+        return self.catalog.taste(self.compositions)
+
+    def fat_quantiles(self, quantile: Union[float, np.ndarray]) -> np.ndarray:
+        return np.percentile(self.fat, np.asarray(quantile) * 100, axis=-1)
+
+    def taste_quantiles(self, quantile: Union[float, np.ndarray]) -> np.ndarray:
+        return np.percentile(self.taste, np.asarray(quantile) * 100, axis=-1)
+
+
+# extrema maintained incrementally by the menu as (nutrient, sign), sign 1 -> minimum, -1 -> maximum
+MENU_EXTREMA: Tuple[Tuple[str, int], ...] = (
+    ("price", 1),
+    ("price", -1),
+    ("calories", 1),
+    ("calories", -1),
+    ("protein", -1),
+)
+
+
+# features of the price regressions (see pizza_sensitivities), in the column order of the statistics
+REGRESSION_FEATURES = ("protein", "carbohydrates", "average_fat")
+
+
+def regression_features(
+    compositions: np.ndarray, catalog: IngredientCatalog = INGREDIENT_CATALOG
+) -> Tuple[np.ndarray, np.ndarray]:
+    # (... x n_features) features and the prices of one composition or a stack of them
+    batch = PizzaMenuBatch(compositions, catalog)
+    features = np.stack([getattr(batch, feature) for feature in REGRESSION_FEATURES], axis=-1)
+    return features, np.asarray(batch.price, dtype=float)
+
+
+class RunningRegressionStatistics:
+    """
+    Sufficient statistics of the regressions price ~ features, updated pizza by pizza.
+
+    Keeps the count, the means and the co-moments sum((x - mean_x)(x - mean_x)^T),
+    sum((x - mean_x)(y - mean_y)) and sum((y - mean_y)^2). Adding and removing a point update
+    them Welford-style (on the deviations from the running means, never on raw sums of squares),
+    so the regressions are O(1) after every change of the menu and do not lose precision.
+    """
+
+    def __init__(self, n_features: int = len(REGRESSION_FEATURES)) -> None:
+        self.n = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.cxx = np.zeros((n_features, n_features))
+        self.cxy = np.zeros(n_features)
+        self.cyy = 0.0
+
+    @classmethod
+    def from_data(cls, features: np.ndarray, prices: np.ndarray) -> "RunningRegressionStatistics":
+        # two-pass statistics of a whole data set
+        statistics = cls(features.shape[1])
+        statistics.n = len(prices)
+        if statistics.n:
+            statistics.mean_x = features.mean(axis=0)
+            statistics.mean_y = float(prices.mean())
+            x = features - statistics.mean_x
+            y = prices - statistics.mean_y
+            statistics.cxx = x.T @ x
+            statistics.cxy = x.T @ y
+            statistics.cyy = float(y @ y)
+        return statistics
+
+    def add(self, x: np.ndarray, y: float) -> None:
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x = self.mean_x + dx / self.n
+        self.mean_y += dy / self.n
+        # deviation from the old mean times the deviation from the new one
+        self.cxx += np.outer(dx, x - self.mean_x)
+        self.cxy += dx * (y - self.mean_y)
+        self.cyy += dy * (y - self.mean_y)
+
+    def remove(self, x: np.ndarray, y: float) -> None:
+        # exact inverse of add
+        if self.n <= 1:
+            self.__init__(len(self.mean_x))
+            return
+        self.n -= 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        mean_x = self.mean_x - dx / self.n
+        mean_y = self.mean_y - dy / self.n
+        self.cxx -= np.outer(x - mean_x, dx)
+        self.cxy -= (x - mean_x) * dy
+        self.cyy -= (y - mean_y) * dy
+        self.mean_x, self.mean_y = mean_x, mean_y
+
+
+class _PizzaList(list):
+    # list of the menu pizzas counting its modifications, so that the menu notices the direct
+    # edits of `pizzas` (appends, replaced items, sorting...) and rebuilds its index
+    version = 0
+
+
+def _counted(name: str):
+    method = getattr(list, name)
+
+    def modify(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+
+    modify.__name__ = name
+    return modify
+
+
+for _name in (
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+    "append",
+    "extend",
+    "insert",
+    "pop",
+    "remove",
+    "clear",
+    "sort",
+    "reverse",
+):
+    setattr(_PizzaList, _name, _counted(_name))
 
 
 @dataclass
 class PizzaMenu:
+    """
+    Menu of pizzas indexed by their composition.
+
+    The menu keeps its own copy of the `pizzas` list it is given (also when `pizzas` is
+    reassigned), so that its direct modifications can be tracked; later changes of the caller's
+    list do not affect the menu. `remove_pizza` moves the last pizza into the freed slot, so it
+    does not preserve the order of the pizzas. A pizza changed in place while on the menu is
+    re-indexed when it is passed to `remove_pizza` or `in`, the extrema re-check the value of the
+    pizza they return; call `reindex` after changing pizzas of the menu otherwise (a changed pizza
+    that is not the current extremum is not noticed before).
+    """
+
     pizzas: List[Pizza]
+    # if False, adding a pizza with the same composition as one already on the menu raises a ValueError
+    allow_duplicates: bool = True
+    # if True, the menu keeps RunningRegressionStatistics up to date, see pizza_sensitivities
+    track_statistics: bool = False
+    # catalog of the pizzas, by default the one of the first pizza (or the built-in catalog)
+    catalog: Optional[IngredientCatalog] = None
+
+    def __setattr__(self, name: str, value) -> None:
+        # the menu keeps its own copy of the pizzas, so that every change of it can be tracked
+        if name == "pizzas":
+            value = _PizzaList(value)
+        super().__setattr__(name, value)
+
+    def __post_init__(self) -> None:
+        if self.catalog is None:
+            self.catalog = self.pizzas[0].catalog if self.pizzas else INGREDIENT_CATALOG
+        self._reindex()
+
+    def _reindex(self) -> None:
+        # hash index of the menu: canonical composition -> positions in `pizzas`, plus the key
+        # of every position (kept so that the index survives pizzas mutated after insertion)
+        self._positions: Dict[CompactPizza, List[int]] = {}
+        self._keys: List[CompactPizza] = []
+        # positions of every pizza object, to notice the pizzas changed in place
+        self._objects: Dict[int, List[int]] = {}
+        for position, pizza in enumerate(self.pizzas):
+            self._check_catalog(pizza)
+            key = pizza.compact
+            if not self.allow_duplicates and key in self._positions:
+                raise ValueError(f"The pizza {pizza.name} is already on the menu.")
+            self._positions.setdefault(key, []).append(position)
+            self._keys.append(key)
+            self._objects.setdefault(id(pizza), []).append(position)
+        # every entry gets a sequence number, the heaps of the extrema refer to the entries by it
+        # and removed entries are dropped from the heaps lazily when they reach the top
+        self._seqs: List[int] = list(range(len(self.pizzas)))
+        self._seq_positions: Dict[int, int] = {seq: seq for seq in self._seqs}
+        self._next_seq = len(self.pizzas)
+        compositions = self.composition_matrix
+        batch = PizzaMenuBatch(compositions, self.catalog)
+        self._statistics = (
+            RunningRegressionStatistics.from_data(*regression_features(compositions, self.catalog))
+            if self.track_statistics
+            else None
+        )
+        self._heaps: Dict[Tuple[str, int], List[Tuple[float, int]]] = {}
+        for nutrient, sign in MENU_EXTREMA:
+            heap = list(zip((sign * getattr(batch, nutrient)).tolist(), self._seqs))
+            heapq.heapify(heap)
+            self._heaps[(nutrient, sign)] = heap
+        self._indexed_pizzas = self.pizzas
+        self._indexed_version = self.pizzas.version
 
-    def to_dataframe(self, sort_by: str, descendent: bool) -> pd.DataFrame:
+    def _compact_heaps(self) -> None:
+        # drop the removed entries once they make up the majority of a heap
+        for extremum, heap in self._heaps.items():
+            if len(heap) > 2 * len(self.pizzas) + 32:
+                heap = [entry for entry in heap if entry[1] in self._seq_positions]
+                heapq.heapify(heap)
+                self._heaps[extremum] = heap
+
+    def _extreme_pizza(self, nutrient: str, sign: int) -> Pizza:
+        self._check_index()
+        heap = self._heaps[(nutrient, sign)]
+        while heap:
+            value, seq = heap[0]
+            if seq not in self._seq_positions:
+                heapq.heappop(heap)
+                continue
+            pizza = self.pizzas[self._seq_positions[seq]]
+            current = sign * getattr(pizza, nutrient)
+            if current == value:
+                return pizza
+            # the pizza was changed in place since it was pushed, push it with its current value
+            heapq.heapreplace(heap, (current, seq))
+        raise ValueError("The menu is empty.")
+
+    def _check_catalog(self, pizza: Pizza) -> None:
+        if pizza.catalog is not self.catalog:
+            raise ValueError(
+                f"The pizza {pizza.name} is not made of the ingredients of the menu catalog."
+            )
+
+    def _check_index(self, pizza: Optional[Pizza] = None) -> None:
+        # `pizzas` is public, rebuild the index if it was reassigned or modified directly, or if
+        # `pizza` is on the menu and was changed in place since it was indexed
+        if self.pizzas is not self._indexed_pizzas or self.pizzas.version != self._indexed_version:
+            self._reindex()
+        elif pizza is not None and any(
+            self._keys[position] != pizza.compact for position in self._objects.get(id(pizza), ())
+        ):
+            self._reindex()
+
+    def reindex(self) -> None:
+        # rebuilds the index, the extrema and the statistics, e.g. after changing pizzas in place
+        self._reindex()
+
+    @property
+    def statistics(self) -> Optional[RunningRegressionStatistics]:
+        # running regression statistics of the menu, None unless track_statistics is set
+        self._check_index()
+        return self._statistics
+
+    @property
+    def composition_matrix(self) -> np.ndarray:
+        # (n_pizzas x n_ingredients) matrix of the stacked pizza compositions
+        return np.array([pizza.composition for pizza in self.pizzas]).reshape(
+            len(self.pizzas), len(self.catalog)
+        )
+
+    @property
+    def batch(self) -> PizzaMenuBatch:
+        return PizzaMenuBatch(self.composition_matrix, self.catalog)
+
+    def to_dataframe(self, sort_by: str, descendent: bool) -> "pd.DataFrame":
         # TODO: transform the list of pizzas into a pandas dataframe, where each row represents a pizza
         # and it contains the following columns: name, price, protein, average_fat, carbohydrates, calories and ingredients
         # where ingredients is a list of ingredients.
@@ -35,67 +332,126 @@ class PizzaMenu:
         #
         # The dataframe should be sorted by the price column in a descendent order
         ### Sorting by ingredients is not defined
-        pizzas_df = []
-        for pizza in self.pizzas:
-            pizzas_df.append(
-                {
-                    "name": pizza.name,
-                    "price": pizza.price,
-                    "protein": pizza.protein,
-                    "average_fat": pizza.average_fat,
-                    "carbohydrates": pizza.carbohydrates,
-                    "calories": pizza.calories,
-                    "ingredients": pizza.ingredients,
-                }
-            ) 
+        import pandas as pd
+
+        batch = self.batch
+        pizzas_df = pd.DataFrame(
+            {
+                "name": [pizza.name for pizza in self.pizzas],
+                "price": batch.price,
+                "protein": batch.protein,
+                "average_fat": batch.average_fat,
+                "carbohydrates": batch.carbohydrates,
+                "calories": batch.calories,
+                "ingredients": [pizza.ingredients for pizza in self.pizzas],
+            }
+        )
         if sort_by!="ingredients":
-            return pd.DataFrame(pizzas_df).sort_values(by = sort_by, ascending=not descendent)
+            return pizzas_df.sort_values(by = sort_by, ascending=not descendent)
         else:
             warnings.warn("Sorting by ingredients is not defined")
-            return pd.DataFrame(pizzas_df)
+            return pizzas_df
        
     @property
     def cheapest_pizza(self) -> Pizza:
         # TODO: return the cheapest pizza from the menu
-       return min(self.pizzas, key=lambda pizza: pizza.price)
+        return self._extreme_pizza("price", 1)
 
     @property
     def most_expensive_pizza(self) -> Pizza:
         # TODO: return the most expensive pizza from the menu
-       return max(self.pizzas, key=lambda pizza: pizza.price)
+        return self._extreme_pizza("price", -1)
         
     @property
     def most_caloric_pizza(self) -> Pizza:
         # TODO: return the most caloric pizza from the menu
-        return max(self.pizzas, key=lambda pizza: pizza.calories)
+        return self._extreme_pizza("calories", -1)
 
     @property
     def fewest_calories_pizza(self) -> Pizza:
         # TODO: return the fewest calories pizza from the menu
-        return min(self.pizzas, key=lambda pizza: pizza.calories)
+        return self._extreme_pizza("calories", 1)
         
     @property
     def most_protein_pizza(self) -> Pizza:
         # TODO: return the most proteinaceous pizza from the menu
-        return max(self.pizzas, key=lambda pizza: pizza.protein)
+        return self._extreme_pizza("protein", -1)
         
     def get_most_fat_pizza(self, quantile: float = 0.5) -> Pizza:
         # TODO: return the most fat pizza from the menu
         # consider the fact that fat is random and it is not always the same, so you should return the pizza that has the most fat in the quantile of cases specified by the quantile parameter
-        return max(self.pizzas, key=lambda pizza: np.percentile(pizza.fat,quantile*100))
+        return self.pizzas[np.argmax(self.batch.fat_quantiles(quantile))]
 
     def add_pizza(self, pizza: Pizza) -> None:
         # TODO: code a function that adds a pizza to the menu
+        self._check_index()
+        self._check_catalog(pizza)
+        key = pizza.compact
+        if not self.allow_duplicates and key in self._positions:
+            raise ValueError(f"The pizza {pizza.name} is already on the menu.")
+        self._positions.setdefault(key, []).append(len(self.pizzas))
+        self._keys.append(key)
+        self._objects.setdefault(id(pizza), []).append(len(self.pizzas))
+        seq = self._next_seq
+        self._next_seq += 1
+        self._seqs.append(seq)
+        self._seq_positions[seq] = len(self.pizzas)
+        for nutrient, sign in MENU_EXTREMA:
+            heapq.heappush(self._heaps[(nutrient, sign)], (sign * getattr(pizza, nutrient), seq))
+        if self._statistics is not None:
+            self._statistics.add(*regression_features(key.composition, self.catalog))
         self.pizzas.append(pizza)
+        self._indexed_version = self.pizzas.version
 
     def remove_pizza(self, pizza: Pizza) -> None:
         # TODO: code a function that removes a pizza from the menu
         # do not forget to check if the pizza is actually in the menu
         # if it is not in the menu, raise a ValueError
-        if (pizza in self.pizzas):
-            self.pizzas.remove(pizza)
-        else:
+        # pizzas are matched by their composition; the removed slot is filled by the last pizza
+        # of the menu, so removal is O(1) but does not preserve the order of the pizzas
+        self._check_index(pizza)
+        key = pizza.compact
+        positions = self._positions.get(key)
+        if not positions:
             raise ValueError("The pizza, you want to remove, is not an element of the menu.")
+        # prefer removing the very same object if it is on the menu
+        same = [i for i, position in enumerate(positions) if self.pizzas[position] is pizza]
+        position = positions.pop(same[0] if same else -1)
+        if not positions:
+            del self._positions[key]
+        del self._seq_positions[self._seqs[position]]
+        self._forget_object(self.pizzas[position], position)
+        if self._statistics is not None:
+            # the statistics got the features of the key the pizza was added with
+            self._statistics.remove(
+                *regression_features(self._keys[position].composition, self.catalog)
+            )
+        last = len(self.pizzas) - 1
+        if position != last:
+            moved_key = self._keys[last]
+            moved_positions = self._positions[moved_key]
+            moved_positions[moved_positions.index(last)] = position
+            moved_objects = self._objects[id(self.pizzas[last])]
+            moved_objects[moved_objects.index(last)] = position
+            self.pizzas[position] = self.pizzas[last]
+            self._keys[position] = moved_key
+            self._seqs[position] = self._seqs[last]
+            self._seq_positions[self._seqs[last]] = position
+        self.pizzas.pop()
+        self._keys.pop()
+        self._seqs.pop()
+        self._indexed_version = self.pizzas.version
+        self._compact_heaps()
+
+    def _forget_object(self, pizza: Pizza, position: int) -> None:
+        positions = self._objects[id(pizza)]
+        positions.remove(position)
+        if not positions:
+            del self._objects[id(pizza)]
+
+    def __contains__(self, pizza: Pizza) -> bool:
+        self._check_index(pizza)
+        return pizza.compact in self._positions
 
     def __len__(self) -> int:
         # TODO: return the number of pizzas in the menu
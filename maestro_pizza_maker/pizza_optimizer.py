@@ -8,14 +8,21 @@
 # hint: you can find inspiration in the minimize_price function
 
 
-from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import astuple, dataclass, field
+import itertools
+from math import comb, prod
+from typing import TYPE_CHECKING, Dict, Hashable, Iterable, List, Optional, Tuple
 
 import numpy as np
 
-from mip import Model, xsum, minimize, maximize, INTEGER, BINARY, OptimizationStatus
+from maestro_pizza_maker.ingredients import INGREDIENT_CATALOG, IngredientCatalog
+from maestro_pizza_maker.pizza import PIZZA_FIELDS, CompactPizza, Pizza
+from maestro_pizza_maker.pizza_menu import PizzaMenu
 
-from maestro_pizza_maker.ingredients import IngredientType, PizzaIngredients
-from maestro_pizza_maker.pizza import Pizza
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 @dataclass
@@ -43,158 +50,541 @@ class PizzaConstraintsIngredients:
     sauce: int = 1
 
 
-def minimize_price(
-    constraints_values: PizzaConstraintsValues,
-    constraints_ingredients: PizzaConstraintsIngredients) -> Pizza:
-    """"""
-    model = Model(solver_name='CBC')
+class InfeasiblePizzaError(Exception):
+    # no pizza satisfies the constraints (or the solver did not reach optimality)
+    pass
 
-    # sets
-    ingredients = [ingredient for ingredient in PizzaIngredients]
-    ingredients_names = [ingredient.name for ingredient in ingredients]
 
-    # variables
-    x = [
-        model.add_var(var_type=INTEGER, lb=0, ub=1, name=ingredient)
-        for ingredient in ingredients_names
-    ]
+# nutrients that can be bounded by PizzaConstraintsValues, "fat" refers to the expected fat
+CONSTRAINED_NUTRIENTS = ("protein", "fat", "carbohydrates", "calories")
 
-    # objective function
-    model.objective = minimize(
-        xsum(x[i] * ingredients[i].value.price for i in range(len(ingredients)))
-    )
+# objective senses, same values as mip.MINIMIZE and mip.MAXIMIZE
+MINIMIZE, MAXIMIZE = "MIN", "MAX"
 
-    # constraints
-    model += (
-        xsum(x[i] * ingredients[i].value.protein for i in range(len(ingredients)))
-        >= constraints_values.protein.min
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.protein for i in range(len(ingredients)))
-        <= constraints_values.protein.max
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.fat.mean() for i in range(len(ingredients)))
-        >= constraints_values.fat.min
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.fat.mean() for i in range(len(ingredients)))
-        <= constraints_values.fat.max
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.carbohydrates for i in range(len(ingredients)))
-        >= constraints_values.carbohydrates.min
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.carbohydrates for i in range(len(ingredients)))
-        <= constraints_values.carbohydrates.max
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.calories for i in range(len(ingredients)))
-        >= constraints_values.calories.min
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.calories for i in range(len(ingredients)))
-        <= constraints_values.calories.max
-    )
+# "mip" solves the CBC model, "enumeration" evaluates all the candidate pizzas at once and
+# "auto" enumerates whenever there are at most `enumeration_threshold` candidates
+OPTIMIZER_BACKENDS = ("auto", "mip", "enumeration")
+ENUMERATION_THRESHOLD = 200_000
+
+# scenario models of maximize_taste_penalty_risk kept per optimizer (least recently used dropped)
+RISK_MODEL_CACHE_SIZE = 4
+# candidate x scenario tastes evaluated at once by the enumeration of maximize_taste_penalty_risk
+RISK_SCORE_BLOCK = 2**22
 
-    model += (
-        xsum(
-            x[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.DOUGH
+
+def count_candidate_pizzas(
+    constraints_ingredients: PizzaConstraintsIngredients, catalog=INGREDIENT_CATALOG
+) -> int:
+    # number of pizzas with the required number of distinct ingredients of every type,
+    # none for a negative count
+    counts = [
+        (catalog.types.count(ingredient_type), getattr(constraints_ingredients, field_name))
+        for ingredient_type, field_name in PIZZA_FIELDS.items()
+    ]
+    if any(count < 0 for _, count in counts):
+        return 0
+    return prod(comb(available, count) for available, count in counts)
+
+
+def enumerate_candidate_pizzas(
+    constraints_ingredients: PizzaConstraintsIngredients, catalog=INGREDIENT_CATALOG
+) -> np.ndarray:
+    # (n_candidates x n_ingredients) binary compositions of all the candidate pizzas,
+    # the cartesian product of the ingredient combinations of every type
+    compositions = np.zeros((1, len(catalog)))
+    for ingredient_type, field_name in PIZZA_FIELDS.items():
+        indices = [i for i, type in enumerate(catalog.types) if type == ingredient_type]
+        count = getattr(constraints_ingredients, field_name)
+        combinations = np.array(list(itertools.combinations(indices, max(count, 0))), dtype=int)
+        if count < 0:
+            combinations = combinations[:0]
+        block = np.zeros((len(combinations), len(catalog)))
+        block[np.repeat(np.arange(len(combinations)), max(count, 0)), combinations.ravel()] = 1
+        compositions = (compositions[:, None, :] + block[None, :, :]).reshape(-1, len(catalog))
+    return compositions
+
+
+def rockafellar_uryasev_ctar(taste: np.ndarray, quantile: float) -> np.ndarray:
+    """
+    CTaR of every row of `taste` (n_items x n_scenarios) in the Rockafellar-Uryasev form
+    max_t t - 1/(q S) sum_s (t - taste_s)^+, the value the linearized optimization model attains.
+    """
+    taste = np.atleast_2d(taste)
+    n_scenarios = taste.shape[1]
+    k = max(int(np.ceil(quantile * n_scenarios - 1e-9)), 1)
+    worst = np.sort(np.partition(taste, k - 1, axis=1)[:, :k], axis=1)
+    t = worst[:, -1]
+    return t - (t[:, None] - worst).sum(axis=1) / (quantile * n_scenarios)
+
+
+class _MipModel:
+    """
+    CBC model of the pizza constraints kept alive between solves.
+
+    One binary variable per ingredient, a lower/upper row per constrained nutrient and a count
+    row per ingredient type. Solves only change right-hand sides, objective and sense.
+    """
+
+    def __init__(
+        self, catalog, coefficients: Dict[str, np.ndarray], limits: Dict[str, float], verbose: int
+    ) -> None:
+        # mip loads the CBC library on import, so it is imported only once a model is built
+        from mip import BINARY, LinExpr, Model
+
+        self.limits = limits
+        self.model = Model(solver_name="CBC")
+        self.model.verbose = verbose
+        self.x = [
+            self.model.add_var(var_type=BINARY, name=ingredient.name)
+            for ingredient in catalog.ingredients
+        ]
+        # all the variables the objective coefficients refer to, the ingredients first
+        self.variables = list(self.x)
+        self.nutrient_rows: Dict[str, Tuple] = {}
+        for nutrient in CONSTRAINED_NUTRIENTS:
+            expression = LinExpr(self.x, coefficients[nutrient].tolist())
+            self.nutrient_rows[nutrient] = (
+                self.model.add_constr(expression >= -limits[nutrient], name=f"{nutrient}_min"),
+                self.model.add_constr(expression <= limits[nutrient], name=f"{nutrient}_max"),
+            )
+        self.count_rows = {
+            field_name: self.model.add_constr(
+                LinExpr(
+                    [x for x, type in zip(self.x, catalog.types) if type == ingredient_type],
+                    [1.0 for type in catalog.types if type == ingredient_type],
+                )
+                == 0,
+                name=f"{field_name}_count",
+            )
+            for ingredient_type, field_name in PIZZA_FIELDS.items()
+        }
+        self.incumbent: Optional[np.ndarray] = None
+
+    def add_scenarios(self, taste_scenarios: np.ndarray) -> None:
+        """
+        Rockafellar-Uryasev variables of the CTaR of the taste over (n_scenarios x n_ingredients) scenarios.
+
+        CTaR_q = max_t t - 1/(q S) sum_s u_s with u_s >= 0, u_s >= t - taste_s(x), so the
+        variables t and u_1..u_S are appended to `variables` for the objective to weight them.
+        """
+        from mip import INF, LinExpr
+
+        n_scenarios = len(taste_scenarios)
+        t = self.model.add_var(lb=-INF, name="taste_at_risk")
+        u = self.model.add_vars(n_scenarios, name="shortfall", lb=0.0)
+        # rows taste_s(x) - t + u_s >= 0: the coefficients of all the rows are built at once,
+        # mip has no bulk row interface, so the rows themselves are still added one by one
+        coefficients = np.hstack(
+            [taste_scenarios, np.full((n_scenarios, 1), -1.0), np.ones((n_scenarios, 1))]
+        ).tolist()
+        shared = self.x + [t]
+        for row, shortfall in zip(coefficients, u):
+            self.model.add_constr(LinExpr(shared + [shortfall], row) >= 0)
+        self.variables += [t] + u
+
+    def set_constraints(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        nutrients: Tuple[str, ...],
+    ) -> None:
+        # nutrients not listed are relaxed
+        for nutrient, (lower, upper) in self.nutrient_rows.items():
+            limit = self.limits[nutrient]
+            if nutrient in nutrients:
+                bounds = getattr(constraints_values, nutrient)
+                lower.rhs = float(np.clip(bounds.min, -limit, limit))
+                upper.rhs = float(np.clip(bounds.max, -limit, limit))
+            else:
+                lower.rhs = -limit
+                upper.rhs = limit
+        for field_name, row in self.count_rows.items():
+            row.rhs = getattr(constraints_ingredients, field_name)
+
+    def solve(self, objective: np.ndarray, sense: str, warm_start: bool = True) -> np.ndarray:
+        # composition of the optimal pizza, objective holds a coefficient per variable
+        from mip import LinExpr, OptimizationStatus
+
+        self.model.objective = LinExpr(self.variables, objective.tolist())
+        self.model.sense = sense
+        if warm_start and self.incumbent is not None:
+            self.model.start = [(x, float(value)) for x, value in zip(self.x, self.incumbent)]
+        self.model.optimize()
+
+        # check solution
+        if self.model.status != OptimizationStatus.OPTIMAL:
+            raise InfeasiblePizzaError(
+                "The model is not optimal -> likely no solution found (infeasible))"
+            )
+
+        self.incumbent = np.array([x.x >= 0.5 for x in self.x], dtype=float)
+        return self.incumbent.copy()
+
+
+class PizzaOptimizer:
+    """
+    Persistent pizza optimizer.
+
+    With the "mip" backend the CBC model (binary variable per ingredient, lower/upper row per
+    nutrient and a count row per ingredient type) is built once on first use. Every solve only
+    updates the right-hand sides, the objective coefficients and the sense, and warm-starts
+    from the previous incumbent. The "enumeration" backend evaluates all the candidate pizzas
+    of the requested ingredient counts with a few matmuls, the candidates are kept per counts.
+    An instance is not thread-safe, use one optimizer per thread/process.
+    """
+
+    def __init__(
+        self,
+        backend: str = "auto",
+        enumeration_threshold: int = ENUMERATION_THRESHOLD,
+        verbose: int = 0,
+        catalog: Optional[IngredientCatalog] = None,
+    ) -> None:
+        if backend not in OPTIMIZER_BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, use one of {OPTIMIZER_BACKENDS}")
+        self.backend = backend
+        self.enumeration_threshold = enumeration_threshold
+        self.verbose = verbose
+        self.catalog = INGREDIENT_CATALOG if catalog is None else catalog
+        # coefficient vectors of the nutrients
+        self.coefficients: Dict[str, np.ndarray] = {
+            "price": self.catalog.nutrients[:, 0],
+            "protein": self.catalog.nutrients[:, 1],
+            "fat": self.catalog.average_fat,
+            "carbohydrates": self.catalog.nutrients[:, 2],
+            "calories": self.catalog.nutrients[:, 3],
+        }
+        # CBC treats a row with an infinite right-hand side as free and cannot change it later,
+        # so infinite bounds are replaced by the largest value a binary pizza can reach
+        self._limits = {
+            nutrient: float(np.abs(coefficients).sum() + 1.0)
+            for nutrient, coefficients in self.coefficients.items()
+        }
+        self._mip_models: Dict[Hashable, _MipModel] = {}
+        self._risk_models: "OrderedDict[Hashable, _MipModel]" = OrderedDict()
+        self._candidates: Dict[Tuple, Tuple[np.ndarray, Dict[str, np.ndarray]]] = {}
+
+    def _mip_model(self, key: Hashable = "base") -> _MipModel:
+        # CBC models are built on first use and kept, "base" holds the plain pizza constraints
+        if key not in self._mip_models:
+            self._mip_models[key] = _MipModel(
+                self.catalog, self.coefficients, self._limits, self.verbose
+            )
+        return self._mip_models[key]
+
+    def _risk_model(self, key: Hashable, taste_scenarios: np.ndarray) -> _MipModel:
+        # CBC models with the scenario constraints of `key`, the scenario models are large, so
+        # only the RISK_MODEL_CACHE_SIZE most recently used of them are kept
+        if key in self._risk_models:
+            self._risk_models.move_to_end(key)
+            return self._risk_models[key]
+        mip_model = _MipModel(self.catalog, self.coefficients, self._limits, self.verbose)
+        mip_model.add_scenarios(taste_scenarios)
+        self._risk_models[key] = mip_model
+        if len(self._risk_models) > RISK_MODEL_CACHE_SIZE:
+            self._risk_models.popitem(last=False)
+        return mip_model
+
+    @property
+    def model(self):
+        return self._mip_model().model
+
+    def _use_enumeration(
+        self, constraints_ingredients: PizzaConstraintsIngredients, backend: Optional[str]
+    ) -> bool:
+        backend = backend or self.backend
+        if backend not in OPTIMIZER_BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, use one of {OPTIMIZER_BACKENDS}")
+        if backend == "auto":
+            return count_candidate_pizzas(constraints_ingredients, self.catalog) <= self.enumeration_threshold
+        return backend == "enumeration"
+
+    def candidates(
+        self, constraints_ingredients: PizzaConstraintsIngredients
+    ) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        # candidate compositions of the ingredient counts and their nutrient values
+        key = astuple(constraints_ingredients)
+        if key not in self._candidates:
+            compositions = enumerate_candidate_pizzas(constraints_ingredients, self.catalog)
+            values = {
+                nutrient: compositions @ coefficients
+                for nutrient, coefficients in self.coefficients.items()
+            }
+            self._candidates[key] = (compositions, values)
+        return self._candidates[key]
+
+    def _feasible_candidates(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        nutrients: Tuple[str, ...],
+    ) -> np.ndarray:
+        compositions, values = self.candidates(constraints_ingredients)
+        feasible = np.ones(len(compositions), dtype=bool)
+        for nutrient in nutrients:
+            bounds = getattr(constraints_values, nutrient)
+            feasible &= (values[nutrient] >= bounds.min - 1e-9) & (values[nutrient] <= bounds.max + 1e-9)
+        return compositions[feasible]
+
+    def _solve(
+        self,
+        objective: np.ndarray,
+        sense: str,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        nutrients: Tuple[str, ...],
+        backend: Optional[str],
+    ) -> np.ndarray:
+        # composition of the optimal pizza
+        if self._use_enumeration(constraints_ingredients, backend):
+            feasible = self._feasible_candidates(constraints_values, constraints_ingredients, nutrients)
+            if len(feasible) == 0:
+                raise InfeasiblePizzaError(
+                    "The model is not optimal -> likely no solution found (infeasible))"
+                )
+            scores = feasible @ objective
+            return feasible[np.argmax(scores) if sense == MAXIMIZE else np.argmin(scores)]
+        mip_model = self._mip_model()
+        mip_model.set_constraints(constraints_values, constraints_ingredients, nutrients)
+        return mip_model.solve(objective, sense)
+
+    def _solve_top_k(
+        self,
+        k: int,
+        objective: np.ndarray,
+        sense: str,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        nutrients: Tuple[str, ...],
+        backend: Optional[str],
+    ) -> List[np.ndarray]:
+        # compositions of the (at most) k best distinct pizzas, best first
+        if k < 1:
+            raise ValueError("k has to be a positive number of pizzas")
+        if self._use_enumeration(constraints_ingredients, backend):
+            feasible = self._feasible_candidates(constraints_values, constraints_ingredients, nutrients)
+            scores = feasible @ objective
+            if sense == MAXIMIZE:
+                scores = -scores
+            best = np.argpartition(scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            best = best[np.argsort(scores[best], kind="stable")]
+            solutions = list(feasible[best])
+        else:
+            from mip import LinExpr
+
+            # every solution found is excluded from the live model by a no-good cut
+            # sum(x_i, i not in S) - sum(x_i, i in S) >= 1 - |S|, the cuts are dropped at the end
+            mip_model = self._mip_model()
+            mip_model.set_constraints(constraints_values, constraints_ingredients, nutrients)
+            solutions, cuts = [], []
+            try:
+                while len(solutions) < k:
+                    try:
+                        solution = mip_model.solve(objective, sense, warm_start=False)
+                    except InfeasiblePizzaError:
+                        break
+                    solutions.append(solution)
+                    cuts.append(
+                        mip_model.model.add_constr(
+                            LinExpr(mip_model.x, (1 - 2 * solution).tolist()) >= 1 - solution.sum()
+                        )
+                    )
+            finally:
+                if cuts:
+                    mip_model.model.remove(cuts)
+        if not solutions:
+            raise InfeasiblePizzaError(
+                "The model is not optimal -> likely no solution found (infeasible))"
+            )
+        return solutions
+
+    def top_k_minimize_price(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        k: int,
+        backend: Optional[str] = None,
+    ) -> PizzaMenu:
+        solutions = self._solve_top_k(
+            k,
+            self.coefficients["price"],
+            MINIMIZE,
+            constraints_values,
+            constraints_ingredients,
+            CONSTRAINED_NUTRIENTS,
+            backend,
         )
-        == constraints_ingredients.dough
-    )
-    model += (
-        xsum(
-            x[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.SAUCE
+        return PizzaMenu(
+            pizzas=[CompactPizza.from_composition(solution, self.catalog).to_pizza() for solution in solutions],
+            allow_duplicates=False,
         )
-        == constraints_ingredients.sauce
-    )
-    model += (
-        xsum(
-            x[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.CHEESE
+
+    def minimize_price(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        backend: Optional[str] = None,
+    ) -> Pizza:
+        composition = self._solve(
+            self.coefficients["price"],
+            MINIMIZE,
+            constraints_values,
+            constraints_ingredients,
+            CONSTRAINED_NUTRIENTS,
+            backend,
         )
-        == constraints_ingredients.cheese
-    )
-    model += (
-        xsum(
-            x[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.MEAT
+        return CompactPizza.from_composition(composition, self.catalog).to_pizza()
+
+    def taste_penalty_price_objective(self, lambda_param: float) -> np.ndarray:
+        # E(taste) - lambda * price per ingredient, see the model description below
+        return self.catalog.weights * self.catalog.average_fat - lambda_param * self.coefficients["price"]
+
+    def maximize_taste_penalty_price(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        lambda_param: float = 0.5,
+        backend: Optional[str] = None,
+    ) -> Pizza:
+        # the model bounds protein, carbohydrates and calories only (no fat constraint)
+        composition = self._solve(
+            self.taste_penalty_price_objective(lambda_param),
+            MAXIMIZE,
+            constraints_values,
+            constraints_ingredients,
+            ("protein", "carbohydrates", "calories"),
+            backend,
         )
-        == constraints_ingredients.meat
-    )
-    model += (
-        xsum(
-            x[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.VEGETABLE
+        return CompactPizza.from_composition(composition, self.catalog).to_pizza()
+
+    def _scenario_indices(
+        self, n_scenarios: Optional[int], seed: int
+    ) -> Tuple[np.ndarray, Hashable]:
+        # all the fat scenarios or a seeded random subsample of n_scenarios of them, plus the key
+        # of the scenario set (the seed only matters for a subsample)
+        total = self.catalog.fat.shape[1]
+        if n_scenarios is None or n_scenarios >= total:
+            return np.arange(total), None
+        indices = np.random.default_rng(seed).choice(total, n_scenarios, replace=False)
+        return np.sort(indices), (n_scenarios, seed)
+
+    def maximize_taste_penalty_risk(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        lambda_param: float = 0.5,
+        risk_aversion: float = 1.0,
+        quantile: float = 0.05,
+        n_scenarios: Optional[int] = None,
+        seed: int = 0,
+        backend: Optional[str] = None,
+    ) -> Pizza:
+        """
+        Risk-aware version of maximize_taste_penalty_price.
+
+        obj = E(taste) - risk_aversion * (E(taste) - CTaR_quantile(taste)) - lambda * price
+
+        The CTaR over the fat scenarios is linearized with Rockafellar-Uryasev (see
+        `_MipModel.add_scenarios`). `n_scenarios` subsamples the scenarios (seeded), so the size
+        of the model does not grow with the number of simulations. The expectation uses all of them.
+        """
+        if not 0 < quantile <= 1:
+            raise ValueError("The quantile has to be in the interval (0, 1]")
+        indices, scenario_key = self._scenario_indices(n_scenarios, seed)
+        # (n_scenarios x n_ingredients) taste of every ingredient in every scenario
+        taste_scenarios = (self.catalog.weights[:, None] * self.catalog.fat[:, indices]).T
+        expected = (1 - risk_aversion) * self.catalog.weights * self.catalog.average_fat
+        objective = expected - lambda_param * self.coefficients["price"]
+        nutrients = ("protein", "carbohydrates", "calories")
+
+        if self._use_enumeration(constraints_ingredients, backend):
+            feasible = self._feasible_candidates(constraints_values, constraints_ingredients, nutrients)
+            if len(feasible) == 0:
+                raise InfeasiblePizzaError(
+                    "The model is not optimal -> likely no solution found (infeasible))"
+                )
+            # the candidate x scenario tastes are evaluated in blocks of candidates
+            scores = feasible @ objective
+            block = max(RISK_SCORE_BLOCK // len(indices), 1)
+            for start in range(0, len(feasible), block):
+                scores[start : start + block] += risk_aversion * rockafellar_uryasev_ctar(
+                    feasible[start : start + block] @ taste_scenarios.T, quantile
+                )
+            composition = feasible[np.argmax(scores)]
+        else:
+            mip_model = self._risk_model(scenario_key, taste_scenarios)
+            mip_model.set_constraints(constraints_values, constraints_ingredients, nutrients)
+            n = len(indices)
+            composition = mip_model.solve(
+                np.concatenate(
+                    [objective, [risk_aversion], np.full(n, -risk_aversion / (quantile * n))]
+                ),
+                MAXIMIZE,
+            )
+        return CompactPizza.from_composition(composition, self.catalog).to_pizza()
+
+    def top_k_maximize_taste_penalty_price(
+        self,
+        constraints_values: PizzaConstraintsValues,
+        constraints_ingredients: PizzaConstraintsIngredients,
+        k: int,
+        lambda_param: float = 0.5,
+        backend: Optional[str] = None,
+    ) -> PizzaMenu:
+        solutions = self._solve_top_k(
+            k,
+            self.taste_penalty_price_objective(lambda_param),
+            MAXIMIZE,
+            constraints_values,
+            constraints_ingredients,
+            ("protein", "carbohydrates", "calories"),
+            backend,
         )
-        == constraints_ingredients.vegetables
-    )
-    model += (
-        xsum(
-            x[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.FRUIT
+        return PizzaMenu(
+            pizzas=[CompactPizza.from_composition(solution, self.catalog).to_pizza() for solution in solutions],
+            allow_duplicates=False,
         )
-        == constraints_ingredients.fruits
-    )
 
-    # optimize
-    model.optimize()
 
-    # check solution
-    if model.status != OptimizationStatus.OPTIMAL:
-        raise Exception(
-            "The model is not optimal -> likely no solution found (infeasible))"
-        )
+_default_optimizer: Optional[PizzaOptimizer] = None
+
+
+def default_optimizer() -> PizzaOptimizer:
+    # optimizer shared by the module level functions, built on first use
+    global _default_optimizer
+    if _default_optimizer is None:
+        _default_optimizer = PizzaOptimizer()
+    return _default_optimizer
+
+
+_catalog_optimizers: Dict[str, PizzaOptimizer] = {}
 
-    # solution
-    return Pizza(
-        dough=[
-            ingredients[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.DOUGH and x[i].x == 1
-        ][0],
-        sauce=[
-            ingredients[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.SAUCE and x[i].x == 1
-        ][0],
-        cheese=[
-            ingredients[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.CHEESE and x[i].x == 1
-        ],
-        meat=[
-            ingredients[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.MEAT and x[i].x == 1
-        ],
-        vegetables=[
-            ingredients[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.VEGETABLE and x[i].x == 1
-        ],
-        fruits=[
-            ingredients[i]
-            for i in range(len(ingredients))
-            if ingredients[i].value.type == IngredientType.FRUIT and x[i].x == 1
-        ],
+
+def catalog_optimizer(catalog: Optional[IngredientCatalog] = None) -> PizzaOptimizer:
+    # persistent optimizer of a catalog (one per fingerprint and process), the default optimizer
+    # for the built-in catalog, used by the batch functions and their worker processes
+    if catalog is None or catalog is INGREDIENT_CATALOG:
+        return default_optimizer()
+    if catalog.fingerprint not in _catalog_optimizers:
+        _catalog_optimizers[catalog.fingerprint] = PizzaOptimizer(catalog=catalog)
+    return _catalog_optimizers[catalog.fingerprint]
+
+
+def minimize_price(
+    constraints_values: PizzaConstraintsValues,
+    constraints_ingredients: PizzaConstraintsIngredients,
+    backend: Optional[str] = None) -> Pizza:
+    """"""
+    return default_optimizer().minimize_price(
+        constraints_values, constraints_ingredients, backend=backend
     )
 
 
 def maximize_taste_penalty_price(
     constraints_values: PizzaConstraintsValues,
     constraints_ingredients: PizzaConstraintsIngredients,
-    lambda_param: float = 0.5) -> Pizza:
+    lambda_param: float = 0.5,
+    backend: Optional[str] = None) -> Pizza:
     # TODO: implement this function (description at the top of the file)
     # recomendation: use latex notation to describe the suggested model
 
@@ -256,140 +646,314 @@ def maximize_taste_penalty_price(
     # \end{array}
     # \end{equation*}
     ######
-    
-    model = Model(solver_name='CBC')
-    
-    # sets
-    ingredients = [ingredient for ingredient in PizzaIngredients]
-    ingredients_names = [ingredient.name for ingredient in ingredients]
-    n = len(ingredients)
-    
-    # variables
-    x = [
-        model.add_var(var_type=BINARY, name=ingredient)
-        for ingredient in ingredients_names
-    ]
-
-    # objective function
-    model.objective = maximize(xsum(x[i]*np.mean(ingredients[i].value.fat)*Pizza.weights[ingredients[i].value.type.name] for i in range(n))
-       - lambda_param*xsum(x[i] * ingredients[i].value.price for i in range(n))
+    return default_optimizer().maximize_taste_penalty_price(
+        constraints_values, constraints_ingredients, lambda_param, backend=backend
     )
 
-    # constraints
-    model += (
-        xsum(x[i] * ingredients[i].value.protein for i in range(n))
-        >= constraints_values.protein.min
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.protein for i in range(n))
-        <= constraints_values.protein.max
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.carbohydrates for i in range(n))
-        >= constraints_values.carbohydrates.min
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.carbohydrates for i in range(n))
-        <= constraints_values.carbohydrates.max
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.calories for i in range(n))
-        >= constraints_values.calories.min
-    )
-    model += (
-        xsum(x[i] * ingredients[i].value.calories for i in range(n))
-        <= constraints_values.calories.max
-    )
 
-    model += (
-        xsum(
-            x[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.DOUGH
-        )
-        == constraints_ingredients.dough
-    )
-    model += (
-        xsum(
-            x[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.SAUCE
-        )
-        == constraints_ingredients.sauce
+def top_k_minimize_price(
+    constraints_values: PizzaConstraintsValues,
+    constraints_ingredients: PizzaConstraintsIngredients,
+    k: int,
+    backend: Optional[str] = None,
+) -> PizzaMenu:
+    # menu of the k cheapest distinct pizzas satisfying the constraints, cheapest first
+    return default_optimizer().top_k_minimize_price(
+        constraints_values, constraints_ingredients, k, backend=backend
     )
-    model += (
-        xsum(
-            x[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.CHEESE
-        )
-        == constraints_ingredients.cheese
+
+
+def top_k_maximize_taste_penalty_price(
+    constraints_values: PizzaConstraintsValues,
+    constraints_ingredients: PizzaConstraintsIngredients,
+    k: int,
+    lambda_param: float = 0.5,
+    backend: Optional[str] = None,
+) -> PizzaMenu:
+    # menu of the k distinct pizzas with the highest E(taste) - lambda * price, best first
+    return default_optimizer().top_k_maximize_taste_penalty_price(
+        constraints_values, constraints_ingredients, k, lambda_param, backend=backend
     )
-    model += (
-        xsum(
-            x[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.MEAT
-        )
-        == constraints_ingredients.meat
+
+
+def maximize_taste_penalty_risk(
+    constraints_values: PizzaConstraintsValues,
+    constraints_ingredients: PizzaConstraintsIngredients,
+    lambda_param: float = 0.5,
+    risk_aversion: float = 1.0,
+    quantile: float = 0.05,
+    n_scenarios: Optional[int] = None,
+    seed: int = 0,
+    backend: Optional[str] = None,
+) -> Pizza:
+    # obj = E(taste) - risk_aversion * (E(taste) - CTaR(taste)) - lambda * price, see PizzaOptimizer
+    return default_optimizer().maximize_taste_penalty_risk(
+        constraints_values,
+        constraints_ingredients,
+        lambda_param,
+        risk_aversion,
+        quantile,
+        n_scenarios,
+        seed,
+        backend=backend,
     )
-    model += (
-        xsum(
-            x[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.VEGETABLE
-        )
-        == constraints_ingredients.vegetables
+
+
+# batches of independent requests
+
+SOLVE_OBJECTIVES = ("minimize_price", "maximize_taste_penalty_price")
+OPTIMAL, INFEASIBLE, ERROR = "optimal", "infeasible", "error"
+
+
+@dataclass
+class PizzaRequest:
+    constraints_values: PizzaConstraintsValues = field(default_factory=PizzaConstraintsValues)
+    constraints_ingredients: PizzaConstraintsIngredients = field(
+        default_factory=PizzaConstraintsIngredients
     )
-    model += (
-        xsum(
-            x[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.FRUIT
+    objective: str = "minimize_price"
+    lambda_param: float = 0.5
+
+
+@dataclass
+class PizzaResult:
+    status: str
+    pizza: Optional[Pizza] = None
+    message: str = ""
+
+    @property
+    def optimal(self) -> bool:
+        return self.status == OPTIMAL
+
+
+# catalog of the worker processes, sent once per process by the pool initializer
+_worker_catalog: Optional[IngredientCatalog] = None
+
+
+def _set_worker_catalog(catalog: IngredientCatalog) -> None:
+    global _worker_catalog
+    _worker_catalog = catalog
+
+
+def _solve_request(
+    problem: Tuple[PizzaRequest, Optional[str]], catalog: Optional[IngredientCatalog] = None
+) -> Tuple[str, Optional[int], str]:
+    # runs in the worker processes on their persistent optimizer of the catalog (the worker
+    # catalog unless given), the pizza is sent back as its code and failures are reported as a
+    # status so one bad request does not sink the batch
+    request, backend = problem
+    optimizer = catalog_optimizer(catalog if catalog is not None else _worker_catalog)
+    try:
+        if request.objective == "minimize_price":
+            pizza = optimizer.minimize_price(
+                request.constraints_values, request.constraints_ingredients, backend=backend
+            )
+        elif request.objective == "maximize_taste_penalty_price":
+            pizza = optimizer.maximize_taste_penalty_price(
+                request.constraints_values,
+                request.constraints_ingredients,
+                request.lambda_param,
+                backend=backend,
+            )
+        else:
+            raise ValueError(f"Unknown objective {request.objective}, use one of {SOLVE_OBJECTIVES}")
+    except InfeasiblePizzaError as error:
+        return INFEASIBLE, None, str(error)
+    except Exception as error:
+        return ERROR, None, f"{type(error).__name__}: {error}"
+    return OPTIMAL, pizza.compact.code, ""
+
+
+def solve_many(
+    requests: Iterable[PizzaRequest],
+    n_jobs: int = 1,
+    backend: Optional[str] = None,
+    chunksize: int = 16,
+    catalog: Optional[IngredientCatalog] = None,
+) -> List[PizzaResult]:
+    """
+    Solves a batch of requests, the results are in the order of the requests.
+
+    Identical requests are solved once. The distinct ones are grouped by their ingredient counts
+    (so a worker reuses its enumerated candidates) and solved on `n_jobs` processes, each keeping
+    its own persistent optimizer. Infeasible or invalid requests get their status in the result
+    instead of raising. The pizzas are made of `catalog` (the built-in catalog by default).
+    """
+    if catalog is None:
+        catalog = INGREDIENT_CATALOG
+    requests = list(requests)
+    # dataclasses -> nested tuples, identical constraints (inf bounds included) give equal keys
+    keys = [astuple(request) for request in requests]
+    unique: Dict[Tuple, PizzaRequest] = {}
+    for key, request in zip(keys, requests):
+        unique.setdefault(key, request)
+    order = sorted(unique, key=lambda key: (key[1], key[2], key[3], key[0]))
+    problems = [(unique[key], backend) for key in order]
+
+    if n_jobs > 1 and len(problems) > 1:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_set_worker_catalog, initargs=(catalog,)
+        ) as executor:
+            solutions = list(executor.map(_solve_request, problems, chunksize=chunksize))
+    else:
+        solutions = [_solve_request(problem, catalog) for problem in problems]
+
+    results = dict(zip(order, solutions))
+    # every duplicate gets its own Pizza, they are mutable
+    return [
+        PizzaResult(
+            status=status,
+            pizza=CompactPizza(code, catalog).to_pizza() if code is not None else None,
+            message=message,
         )
-        == constraints_ingredients.fruits
-    )
+        for status, code, message in (results[key] for key in keys)
+    ]
+
+
+# efficient frontier of the taste vs. price trade-off
+
 
-    # optimize
-    model.optimize()
+def _solve_taste_penalty_price(
+    problem: Tuple[PizzaConstraintsValues, PizzaConstraintsIngredients, float],
+    catalog: Optional[IngredientCatalog] = None,
+) -> int:
+    # runs in the worker processes (on the worker catalog unless given), every process keeps its
+    # own persistent model
+    constraints_values, constraints_ingredients, lambda_param = problem
+    if catalog is None:
+        catalog = _worker_catalog
+    return catalog_optimizer(catalog).maximize_taste_penalty_price(
+        constraints_values, constraints_ingredients, lambda_param
+    ).compact.code
 
-    # check solution
-    if model.status != OptimizationStatus.OPTIMAL:
-        raise Exception(
-            "The model is not optimal -> likely no solution found (infeasible))"
+
+@dataclass
+class FrontierSegment:
+    pizza: Pizza
+    lambda_min: float
+    lambda_max: float
+    expected_taste: float
+    price: float
+
+
+@dataclass
+class TastePriceFrontier:
+    segments: List[FrontierSegment]
+    n_solves: int
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        import pandas as pd
+
+        return pd.DataFrame(
+            [
+                {
+                    "name": segment.pizza.name,
+                    "lambda_min": segment.lambda_min,
+                    "lambda_max": segment.lambda_max,
+                    "expected_taste": segment.expected_taste,
+                    "price": segment.price,
+                }
+                for segment in self.segments
+            ]
         )
 
-    # solution
-    return Pizza(
-        dough=[
-            ingredients[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.DOUGH and x[i].x == 1
-        ][0],
-        sauce=[
-            ingredients[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.SAUCE and x[i].x == 1
-        ][0],
-        cheese=[
-            ingredients[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.CHEESE and x[i].x == 1
-        ],
-        meat=[
-            ingredients[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.MEAT and x[i].x == 1
-        ],
-        vegetables=[
-            ingredients[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.VEGETABLE and x[i].x == 1
-        ],
-        fruits=[
-            ingredients[i]
-            for i in range(n)
-            if ingredients[i].value.type == IngredientType.FRUIT and x[i].x == 1
-        ],
-    )
 
+def taste_price_frontier(
+    constraints_values: PizzaConstraintsValues,
+    constraints_ingredients: PizzaConstraintsIngredients,
+    lambda_min: float = 0.0,
+    lambda_max: float = 10.0,
+    n_jobs: int = 1,
+    catalog: Optional[IngredientCatalog] = None,
+) -> TastePriceFrontier:
+    """
+    All the Pareto-optimal pizzas of maximize_taste_penalty_price for lambda in [lambda_min, lambda_max].
+
+    The optimal value E(taste) - lambda * price is convex and piecewise linear in lambda, so the
+    breakpoints are found exactly (Eisner-Severance): two solutions optimal at the ends of an
+    interval are optimal on all of it if they coincide, otherwise the model is solved once more
+    where their objective lines intersect. Intervals are refined level by level and the solves
+    of one level run in parallel on `n_jobs` processes. The pizzas are made of `catalog` (the
+    built-in catalog by default).
+    """
+    if catalog is None:
+        catalog = INGREDIENT_CATALOG
+    expected_taste_coefficients = catalog.weights * catalog.average_fat
+    price_coefficients = catalog.nutrients[:, 0]
+
+    def line(pizza: CompactPizza) -> Tuple[float, float]:
+        composition = pizza.composition
+        return float(composition @ expected_taste_coefficients), float(composition @ price_coefficients)
+
+    executor = (
+        ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_set_worker_catalog, initargs=(catalog,)
+        )
+        if n_jobs > 1
+        else None
+    )
+    n_solves = 0
+
+    def solve_all(lambdas: List[float]) -> List[CompactPizza]:
+        nonlocal n_solves
+        n_solves += len(lambdas)
+        problems = [
+            (constraints_values, constraints_ingredients, lambda_param) for lambda_param in lambdas
+        ]
+        if executor is not None:
+            codes = executor.map(_solve_taste_penalty_price, problems)
+        else:
+            codes = [_solve_taste_penalty_price(problem, catalog) for problem in problems]
+        return [CompactPizza(code, catalog) for code in codes]
+
+    try:
+        left, right = solve_all([lambda_min, lambda_max])
+        # breakpoints[lambda] = pizza optimal right after lambda
+        breakpoints = {lambda_min: left}
+        pending = [(lambda_min, left, lambda_max, right)]
+        while pending:
+            intersections = []
+            for lambda_left, pizza_left, lambda_right, pizza_right in pending:
+                (taste_left, price_left), (taste_right, price_right) = line(pizza_left), line(pizza_right)
+                if pizza_left == pizza_right or np.isclose(price_left, price_right):
+                    continue
+                intersections.append(
+                    (
+                        (taste_left - taste_right) / (price_left - price_right),
+                        lambda_left,
+                        pizza_left,
+                        lambda_right,
+                        pizza_right,
+                    )
+                )
+            solutions = solve_all([intersection[0] for intersection in intersections])
+            pending = []
+            for (lambda_cross, lambda_left, pizza_left, lambda_right, pizza_right), pizza in zip(
+                intersections, solutions
+            ):
+                taste_left, price_left = line(pizza_left)
+                taste, price = line(pizza)
+                value_left = taste_left - lambda_cross * price_left
+                if taste - lambda_cross * price <= value_left + 1e-9 * max(1.0, abs(value_left)):
+                    # nothing beats the two lines where they cross -> a breakpoint
+                    breakpoints[lambda_cross] = pizza_right
+                else:
+                    pending += [
+                        (lambda_left, pizza_left, lambda_cross, pizza),
+                        (lambda_cross, pizza, lambda_right, pizza_right),
+                    ]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # merge the consecutive intervals of the same pizza
+    segments: List[FrontierSegment] = []
+    lambdas = sorted(breakpoints)
+    for start, end in zip(lambdas, lambdas[1:] + [lambda_max]):
+        pizza = breakpoints[start]
+        if segments and segments[-1].pizza.compact == pizza:
+            segments[-1].lambda_max = end
+            continue
+        taste, price = line(pizza)
+        segments.append(FrontierSegment(pizza.to_pizza(), start, end, taste, price))
+    return TastePriceFrontier(segments=segments, n_solves=n_solves)
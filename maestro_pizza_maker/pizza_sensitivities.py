@@ -7,28 +7,205 @@
 # TODO: implement above mentioned sensitivities
 # hint: simple linear regression might be helpful
 
-from maestro_pizza_maker.pizza_menu import PizzaMenu
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
 
-from sklearn.linear_model import LinearRegression 
+from maestro_pizza_maker.pizza_menu import (
+    REGRESSION_FEATURES,
+    PizzaMenu,
+    RunningRegressionStatistics,
+    regression_features,
+)
 
 import numpy as np
 
+# features regressed against the price, in the column order of the feature matrix
+SENSITIVITY_FEATURES = REGRESSION_FEATURES
+
+
+@dataclass
+class MenuSensitivities:
+    """
+    Price sensitivities of a menu, one entry per SENSITIVITY_FEATURES.
+
+    `slopes` and `intercepts` are the simple regressions price ~ a + b * feature (the
+    menu_sensitivity_* values), `standard_errors` their OLS standard errors. `coefficients`
+    (with `intercept`) is the multivariate regression price ~ a + sum b_j * feature_j.
+    """
+
+    n_pizzas: int
+    slopes: np.ndarray
+    intercepts: np.ndarray
+    standard_errors: Optional[np.ndarray] = None
+    coefficients: Optional[np.ndarray] = None
+    intercept: Optional[float] = None
+
+    def slope(self, feature: str) -> float:
+        return float(self.slopes[SENSITIVITY_FEATURES.index(feature)])
+
+
+def menu_features(menu: PizzaMenu) -> Tuple[np.ndarray, np.ndarray]:
+    # (n_pizzas x n_features) feature matrix and the prices, from one matmul of the menu compositions
+    features, prices = regression_features(menu.composition_matrix, menu.catalog)
+    return features.reshape(len(menu), len(SENSITIVITY_FEATURES)), prices.reshape(len(menu))
+
+
+def statistics_sensitivities(
+    statistics: RunningRegressionStatistics,
+    standard_errors: bool = False,
+    multivariate: bool = False,
+) -> MenuSensitivities:
+    """
+    Closed-form least squares from the means and co-moments of the data.
+
+    slope = cov(x, y) / var(x); a constant feature gets a zero slope (as the minimum-norm
+    solution of LinearRegression does). At least two pizzas are needed.
+    """
+    if statistics.n < 2:
+        raise ValueError(f"The sensitivities need at least two pizzas, got {statistics.n}")
+    n, x_mean, y_mean = statistics.n, statistics.mean_x, statistics.mean_y
+    sxx = np.diag(statistics.cxx)
+    sxy = statistics.cxy
+    constant = sxx <= 1e-12 * np.maximum(1.0, sxx + n * x_mean**2)
+    slopes = np.where(constant, 0.0, sxy / np.where(constant, 1.0, sxx))
+    result = MenuSensitivities(n_pizzas=n, slopes=slopes, intercepts=y_mean - slopes * x_mean)
+    if standard_errors:
+        # residual sum of squares of every simple regression: syy - b * sxy
+        rss = np.maximum(statistics.cyy - slopes * sxy, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result.standard_errors = np.where(
+                constant | (n <= 2), np.nan, np.sqrt(rss / (n - 2) / sxx)
+            )
+    if multivariate:
+        # minimum-norm solution of the normal equations of the centered data
+        coefficients = np.linalg.lstsq(statistics.cxx, sxy, rcond=None)[0]
+        result.coefficients = coefficients
+        result.intercept = float(y_mean - x_mean @ coefficients)
+    return result
+
+
+def sensitivities(
+    features: np.ndarray,
+    prices: np.ndarray,
+    standard_errors: bool = False,
+    multivariate: bool = False,
+) -> MenuSensitivities:
+    # least squares of the prices on every column of `features`
+    return statistics_sensitivities(
+        RunningRegressionStatistics.from_data(features, prices), standard_errors, multivariate
+    )
+
+
+def menu_sensitivities(
+    menu: PizzaMenu, standard_errors: bool = False, multivariate: bool = False
+) -> MenuSensitivities:
+    # all the sensitivities of the menu in a single pass, O(1) if the menu tracks its statistics
+    statistics = menu.statistics
+    if statistics is None:
+        statistics = RunningRegressionStatistics.from_data(*menu_features(menu))
+    return statistics_sensitivities(statistics, standard_errors, multivariate)
+
+
 def menu_sensitivity_protein(menu: PizzaMenu) -> float:
-    # TODO: implement according to the description above
-    model = LinearRegression()
-    model.fit(np.array([pizza.protein for pizza in menu.pizzas]).reshape(-1,1), np.array([pizza.price for pizza in menu.pizzas]))
-    return model.coef_[0]
+    return menu_sensitivities(menu).slope("protein")
 
 
 def menu_sensitivity_carbs(menu: PizzaMenu) -> float:
-    # TODO: implement according to the description above
-    model = LinearRegression()
-    model.fit(np.array([pizza.carbohydrates for pizza in menu.pizzas]).reshape(-1,1), np.array([pizza.price for pizza in menu.pizzas]))
-    return model.coef_[0]
+    return menu_sensitivities(menu).slope("carbohydrates")
 
 
 def menu_sensitivity_fat(menu: PizzaMenu) -> float:
-    # TODO: implement according to the description above
-    model = LinearRegression()
-    model.fit(np.array([pizza.average_fat for pizza in menu.pizzas]).reshape(-1,1), np.array([pizza.price for pizza in menu.pizzas]))
-    return model.coef_[0]
+    return menu_sensitivities(menu).slope("average_fat")
+
+
+# bootstrap confidence intervals of the sensitivities
+
+
+@dataclass
+class SensitivityBootstrap:
+    # point estimates and the percentile confidence intervals, one entry per SENSITIVITY_FEATURES
+    slopes: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    confidence: float
+    # (n_resamples x n_features) bootstrap slopes
+    samples: np.ndarray
+
+    def interval(self, feature: str) -> Tuple[float, float]:
+        i = SENSITIVITY_FEATURES.index(feature)
+        return float(self.lower[i]), float(self.upper[i])
+
+
+def batched_slopes(features: np.ndarray, prices: np.ndarray) -> np.ndarray:
+    # simple regression slopes of a stack of data sets, (B x n x p) features and (B x n) prices
+    x = features - features.mean(axis=1, keepdims=True)
+    y = prices - prices.mean(axis=1, keepdims=True)
+    sxx = np.einsum("bij,bij->bj", x, x)
+    sxy = np.einsum("bij,bi->bj", x, y)
+    constant = sxx <= 1e-12 * np.maximum(1.0, np.einsum("bij,bij->bj", features, features))
+    return np.where(constant, 0.0, sxy / np.where(constant, 1.0, sxx))
+
+
+def _bootstrap_chunk(
+    problem: Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], int, np.random.SeedSequence]
+) -> np.ndarray:
+    # slopes of n_resamples resamples, every chunk has its own seed so that the result does not
+    # depend on the number of processes
+    features, prices, fat_by_pizza, n_resamples, seed = problem
+    rng = np.random.default_rng(seed)
+    n_pizzas = len(prices)
+    # (n_resamples x n_pizzas) index matrix of the resampled pizzas
+    indices = rng.integers(0, n_pizzas, size=(n_resamples, n_pizzas))
+    resampled_features = features[indices]
+    if fat_by_pizza is not None:
+        # resampled fat scenarios: average fat of every pizza over the drawn scenarios, the draws
+        # are turned into scenario counts so the averages are one matmul
+        n_scenarios = fat_by_pizza.shape[1]
+        draws = rng.integers(0, n_scenarios, size=(n_resamples, n_scenarios))
+        counts = np.zeros((n_resamples, n_scenarios))
+        np.add.at(counts, (np.arange(n_resamples)[:, None], draws), 1.0)
+        average_fat = (counts @ fat_by_pizza.T) / n_scenarios
+        column = SENSITIVITY_FEATURES.index("average_fat")
+        resampled_features[:, :, column] = np.take_along_axis(average_fat, indices, axis=1)
+    return batched_slopes(resampled_features, prices[indices])
+
+
+def bootstrap_sensitivities(
+    menu: PizzaMenu,
+    n_resamples: int = 1000,
+    confidence: float = 0.95,
+    resample_fat: bool = False,
+    seed: int = 0,
+    n_jobs: int = 1,
+    chunk_size: int = 256,
+) -> SensitivityBootstrap:
+    """
+    Percentile bootstrap confidence intervals of all the menu sensitivities.
+
+    The pizzas are resampled with replacement; with `resample_fat` the fat scenarios behind
+    the average fat are resampled as well. The resamples are index matrices and all the slopes
+    of a chunk of `chunk_size` resamples are computed at once, the chunks run on `n_jobs` processes.
+    """
+    features, prices = menu_features(menu)
+    fat_by_pizza = menu.composition_matrix @ menu.catalog.fat if resample_fat else None
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    problems = [
+        (features, prices, fat_by_pizza, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)
+    ]
+    if n_jobs > 1 and len(problems) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chunks = list(executor.map(_bootstrap_chunk, problems))
+    else:
+        chunks = [_bootstrap_chunk(problem) for problem in problems]
+    samples = np.concatenate(chunks).reshape(n_resamples, len(SENSITIVITY_FEATURES))
+    alpha = (1 - confidence) / 2
+    lower, upper = np.percentile(samples, [100 * alpha, 100 * (1 - alpha)], axis=0)
+    return SensitivityBootstrap(
+        slopes=sensitivities(features, prices).slopes,
+        lower=lower,
+        upper=upper,
+        confidence=confidence,
+        samples=samples,
+    )
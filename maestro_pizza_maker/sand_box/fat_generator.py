@@ -1,28 +1,351 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+import os
+from pathlib import Path
+from typing import Optional, Tuple, Union
+import warnings
+
 import numpy as np
 
+# default location of the persisted fat scenarios (the `data` folder of the repository),
+# can be overridden by the MAESTRO_PIZZA_DATA_DIR environment variable
+DATA_DIR = Path(
+    os.environ.get("MAESTRO_PIZZA_DATA_DIR", Path(__file__).resolve().parents[2] / "data")
+)
+
+# number of scenarios drawn (and held in memory) at once by a worker
+CHUNK_SIZE = 100_000
+
+# "mc" plain Monte Carlo, "antithetic" pairs z with -z, "lhs" Latin hypercube and "sobol"
+# scrambled Sobol points (needs scipy), the last two mapped through the inverse normal CDF
+SAMPLING_METHODS = ("mc", "antithetic", "lhs", "sobol")
+
+# coefficients of Acklam's rational approximation of the inverse normal CDF
+_NDTRI_A = (-3.969683028665376e01, 2.209460984245205e02, -2.759285104469687e02, 1.383577518672690e02, -3.066479806614716e01, 2.506628277459239e00)
+_NDTRI_B = (-5.447609879822406e01, 1.615858368580409e02, -1.556989798598866e02, 6.680131188771972e01, -1.328068155288572e01)
+_NDTRI_C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e00, -2.549732539343734e00, 4.374664141464968e00, 2.938163982698783e00)
+_NDTRI_D = (7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e00, 3.754408661907416e00)
+
+
+def inverse_normal_cdf(u: np.ndarray) -> np.ndarray:
+    """
+    Standard normal quantiles of u in (0, 1), relative error below 1.2e-9 (Acklam).
+
+    Pure numpy, so the quasi-Monte Carlo modes do not need scipy.special.ndtri.
+    """
+    u = np.asarray(u, dtype=float)
+    a, b, c, d = _NDTRI_A, _NDTRI_B, _NDTRI_C, _NDTRI_D
+    z = np.empty_like(u)
+    low = u < 0.02425
+    high = u > 1 - 0.02425
+    central = ~(low | high)
+
+    q = u[central] - 0.5
+    r = q * q
+    z[central] = (
+        (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q
+        / (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+    )
+    for tail, sign in ((low, 1.0), (high, -1.0)):
+        q = np.sqrt(-2 * np.log(np.where(sign > 0, u[tail], 1 - u[tail])))
+        z[tail] = sign * (
+            ((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]
+        ) / ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    return z
+
 
-def _generate_positive_semi_definite_matrix(dim: int) -> np.array:
+def standard_normal_points(
+    dim: int, n_points: int, rng: np.random.Generator, method: str = "mc"
+) -> np.ndarray:
+    # (dim x n_points) standard normal points of the sampling method
+    if method == "mc":
+        return rng.standard_normal((dim, n_points))
+    if method == "antithetic":
+        half = rng.standard_normal((dim, (n_points + 1) // 2))
+        return np.concatenate([half, -half], axis=1)[:, :n_points]
+    if method == "lhs":
+        # one point in every one of the n_points strata of every dimension, strata shuffled per dimension
+        strata = rng.permuted(np.tile(np.arange(n_points), (dim, 1)), axis=1)
+        return inverse_normal_cdf((strata + rng.random((dim, n_points))) / n_points)
+    if method == "sobol":
+        try:
+            from scipy.stats import qmc
+        except ImportError as error:
+            raise ImportError("The sobol sampling method needs scipy") from error
+        sobol = qmc.Sobol(d=dim, scramble=True, seed=rng)
+        # a power of two keeps the balance properties, the surplus points are dropped
+        points = sobol.random_base2(int(np.ceil(np.log2(max(n_points, 1)))))[:n_points]
+        return inverse_normal_cdf(np.clip(points, 1e-12, 1 - 1e-12)).T
+    raise ValueError(f"Unknown sampling method {method}, use one of {SAMPLING_METHODS}")
+
+
+def _generate_positive_semi_definite_matrix(dim: int, rng: np.random.Generator) -> np.array:
     """
     Generates a positive semi-definite matrix of dimension dim to be used as a covariance matrix.
     """
-    dummy_matrix = np.random.rand(dim, dim)
+    dummy_matrix = rng.random((dim, dim))
     return np.dot(dummy_matrix, dummy_matrix.transpose())
 
 
-def _generate_normal_vector(dim: int) -> np.array:
+def _generate_normal_vector(dim: int, rng: np.random.Generator) -> np.array:
     """
     Generates a vector of dimension dim with values from a normal distribution.
     """
-    return np.random.normal(size=dim, loc=30, scale=5).clip(min=1)
+    return rng.normal(size=dim, loc=30, scale=5).clip(min=1)
+
+
+def _generate_multivariate_normal_vector(
+    dim: int, n_simulations: int, rng: np.random.Generator
+) -> np.array:
+    """
+    Generates n_simulations vectors of dimension dim with values from a multivariate normal distribution.
+    """
+    distribution = FatDistribution.random(dim, rng)
+    return distribution.sample(n_simulations, rng).transpose()
+
+
+@dataclass(frozen=True, eq=False)
+class FatDistribution:
+    """
+    Multivariate normal distribution of the fat of the ingredients, clipped at `clip_min`.
+
+    The covariance is factorized once (Cholesky, cached on the instance) and every draw is
+    mean + L @ z for standard normal z, so sampling costs one matmul per chunk.
+    """
+
+    mean: np.ndarray
+    cov: np.ndarray
+    clip_min: float = 0.1
+
+    @classmethod
+    def random(cls, dim: int, rng: np.random.Generator) -> "FatDistribution":
+        mean = _generate_normal_vector(dim, rng)
+        cov = _generate_positive_semi_definite_matrix(dim, rng)
+        return cls(mean=mean, cov=cov)
+
+    @property
+    def dim(self) -> int:
+        return len(self.mean)
+
+    @cached_property
+    def cholesky(self) -> np.ndarray:
+        # lower triangular L with L @ L.T == cov; singular covariances fall back to the
+        # (non-triangular) factor V sqrt(diag(eigenvalues)) of the eigendecomposition
+        try:
+            return np.linalg.cholesky(self.cov)
+        except np.linalg.LinAlgError:
+            eigenvalues, eigenvectors = np.linalg.eigh(self.cov)
+            return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+    def sample(
+        self,
+        n_simulations: int,
+        rng: np.random.Generator,
+        out: Optional[np.ndarray] = None,
+        method: str = "mc",
+    ) -> np.ndarray:
+        # (dim x n_simulations) clipped drawings of the sampling method, written into `out` if given
+        if out is None:
+            out = np.empty((self.dim, n_simulations))
+        z = standard_normal_points(self.dim, n_simulations, rng, method)
+        np.matmul(self.cholesky, z, out=out)
+        out += self.mean[:, None]
+        np.clip(out, self.clip_min, None, out=out)
+        return out
+
+    def tail_shift(self, weights: np.ndarray, quantile: float) -> np.ndarray:
+        # shift of the standard normals that centers the drawings of weights @ fat at its quantile
+        direction = self.cholesky.T @ np.asarray(weights, dtype=float)
+        norm = np.linalg.norm(direction)
+        if norm == 0:
+            return np.zeros(self.dim)
+        return inverse_normal_cdf(np.array([quantile]))[0] * direction / norm
+
+    def importance_sample(
+        self,
+        n_simulations: int,
+        rng: np.random.Generator,
+        shift: np.ndarray,
+        method: str = "mc",
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Drawings with the standard normals centered at `shift` and their likelihood ratios.
+
+        Returns the (dim x n_simulations) drawings and the weights dP/dQ = exp(-shift.z + |shift|^2 / 2),
+        the weighted drawings estimate the expectations of the original distribution.
+        """
+        shift = np.asarray(shift, dtype=float)
+        z = standard_normal_points(self.dim, n_simulations, rng, method) + shift[:, None]
+        weights = np.exp(shift @ shift / 2 - shift @ z)
+        drawings = self.cholesky @ z
+        drawings += self.mean[:, None]
+        np.clip(drawings, self.clip_min, None, out=drawings)
+        return drawings, weights
+
+
+def _chunks(n_simulations: int, chunk_size: int) -> list:
+    return [
+        (start, min(start + chunk_size, n_simulations))
+        for start in range(0, n_simulations, chunk_size)
+    ]
+
+
+def _sample_chunk(
+    problem: Tuple[FatDistribution, int, int, np.random.SeedSequence, Optional[str], str]
+) -> Optional[np.ndarray]:
+    # runs in the worker processes: draws the columns start:stop and writes them into the .npy
+    # file directly (opened as a memory map), or returns them if there is no file
+    distribution, start, stop, seed, path, method = problem
+    rng = np.random.default_rng(seed)
+    if path is None:
+        return distribution.sample(stop - start, rng, method=method)
+    out = np.lib.format.open_memmap(path, mode="r+")
+    distribution.sample(stop - start, rng, out=out[:, start:stop], method=method)
+    out.flush()
+    return None
+
+
+def generate_scenarios(
+    distribution: FatDistribution,
+    n_simulations: int,
+    seed: Union[int, np.random.SeedSequence],
+    out: Union[np.ndarray, str, Path, None] = None,
+    chunk_size: int = CHUNK_SIZE,
+    n_jobs: int = 1,
+    method: str = "mc",
+) -> np.ndarray:
+    """
+    (dim x n_simulations) fat scenarios drawn chunk by chunk.
+
+    Every chunk of `chunk_size` scenarios has its own seed stream spawned from `seed`, so the
+    result is the same for any number of processes `n_jobs` (but not for another chunk size).
+    `out` is a preallocated array or the path of a .npy file that is created and filled through
+    a memory map by the workers, only one chunk per worker is in memory at a time. The sampling
+    `method` (see SAMPLING_METHODS) applies within every chunk.
+    """
+    seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    chunks = _chunks(n_simulations, chunk_size)
+    seeds = seed.spawn(len(chunks))
+    shape = (distribution.dim, n_simulations)
+    path = None
+    if out is None:
+        out = np.empty(shape)
+    elif isinstance(out, (str, Path)):
+        path = str(out)
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=float, shape=shape)
+    elif out.shape != shape:
+        raise ValueError(f"The output buffer has to be of shape {shape}, got {out.shape}")
+
+    if n_jobs > 1 and len(chunks) > 1:
+        if path is not None:
+            # the workers write through their own memory maps of the file
+            out.flush()
+        # factorize the covariance once, the cached factor is pickled along to the workers
+        distribution.cholesky
+        problems = [
+            (distribution, start, stop, chunk_seed, path, method)
+            for (start, stop), chunk_seed in zip(chunks, seeds)
+        ]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            for (start, stop), samples in zip(chunks, executor.map(_sample_chunk, problems)):
+                if samples is not None:
+                    out[:, start:stop] = samples
+    else:
+        for (start, stop), chunk_seed in zip(chunks, seeds):
+            distribution.sample(
+                stop - start, np.random.default_rng(chunk_seed), out=out[:, start:stop], method=method
+            )
+    if path is not None:
+        out.flush()
+    return out
+
+
+@dataclass(frozen=True)
+class FatScenarioStore:
+    """
+    Seeded fat scenarios persisted as a (dim x n_simulations) .npy file.
+
+    The scenarios are generated once per (dim, n_simulations, seed) and then memory-mapped
+    read-only, so loading is zero-copy, independent of the number of scenarios and all the
+    processes using the same store share the same pages and the same drawings.
+    """
+
+    dim: int = 16
+    n_simulations: int = 1000
+    seed: int = 2023
+    directory: Path = DATA_DIR
+    # processes generating the scenarios, the drawings do not depend on it
+    n_jobs: int = field(default=1, compare=False)
+
+    @property
+    def path(self) -> Path:
+        return Path(self.directory) / (
+            f"fat_scenarios_{self.dim}x{self.n_simulations}_seed{self.seed}.npy"
+        )
+
+    def _seeds(self) -> Tuple[np.random.SeedSequence, np.random.SeedSequence]:
+        # independent streams of the distribution parameters and of the scenarios
+        return tuple(np.random.SeedSequence(self.seed).spawn(2))
+
+    def distribution(self) -> FatDistribution:
+        return FatDistribution.random(self.dim, np.random.default_rng(self._seeds()[0]))
+
+    def generate(self, out: Union[np.ndarray, str, Path, None] = None) -> np.array:
+        return generate_scenarios(
+            self.distribution(),
+            self.n_simulations,
+            self._seeds()[1],
+            out=out,
+            n_jobs=self.n_jobs,
+        )
+
+    def _tmp_path(self) -> Path:
+        path = self.path
+        return path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+
+    def save(self, simulations: np.array) -> Path:
+        # write to a private file first and rename it, concurrent writers never expose a partial file
+        path = self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._tmp_path()
+        np.save(tmp_path, simulations)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self) -> np.array:
+        if not self.path.exists():
+            tmp_path = self._tmp_path()
+            try:
+                # generated straight into the (private) file, nothing but one chunk per worker in memory
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.generate(out=tmp_path)
+                os.replace(tmp_path, self.path)
+            except OSError as error:
+                warnings.warn(f"Fat scenarios could not be persisted ({error}), using them in memory")
+                if tmp_path.exists():
+                    tmp_path.unlink()
+                return self.generate()
+        return np.load(self.path, mmap_mode="r")
+
+
+FAT_SCENARIO_STORE = FatScenarioStore()
+
+_fat_simulations = None
 
 
-def _generate_multivariate_normal_vector(dim: int) -> np.array:
+def fat_simulations() -> np.array:
     """
-    Generates a vector of dimension dim with values from a multivariate normal distribution.
+    Returns the (dim x n_simulations) fat scenarios of the default store, loaded on first use.
     """
-    mean = _generate_normal_vector(dim)
-    cov = _generate_positive_semi_definite_matrix(dim)
-    return np.random.multivariate_normal(mean, cov, 1000).clip(min=0.1)
+    global _fat_simulations
+    if _fat_simulations is None:
+        _fat_simulations = FAT_SCENARIO_STORE.load()
+    return _fat_simulations
 
 
-FAT_SIMULATIONS = _generate_multivariate_normal_vector(16).transpose()
+def __getattr__(name: str):
+    # FAT_SIMULATIONS is kept as a lazily loaded module attribute
+    if name == "FAT_SIMULATIONS":
+        return fat_simulations()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,140 @@
+# Streaming version of the Taste at Risk (TaR) and Conditional Taste at Risk (CTaR) measures.
+# The taste drawings are consumed chunk by chunk, so the memory stays bounded no matter how many
+# fat scenarios are simulated. The estimator keeps:
+#   - the exact lower tail of the drawings (the `tail_capacity` smallest tastes seen so far),
+#   - a uniform random sample of all the drawings (bottom-k sampling on random keys).
+# While the quantile falls into the exact tail the results are exact (identical to np.percentile),
+# otherwise the quantile is estimated from the sample and reported with a confidence interval.
+
+from dataclasses import dataclass
+from typing import Iterable, Union
+
+import numpy as np
+
+from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.pizza_menu import PizzaMenu
+from maestro_pizza_maker.taste_at_risk import taste_weights
+
+# normal quantile of the two-sided 95% confidence intervals
+_Z_95 = 1.959963984540054
+
+
+@dataclass
+class TasteAtRiskEstimate:
+    taste_at_risk: float
+    conditional_taste_at_risk: float
+    n_samples: int
+    exact: bool
+    # half-widths of the ~95% confidence intervals, zero for exact results
+    taste_at_risk_error: float = 0.0
+    conditional_taste_at_risk_error: float = 0.0
+
+
+class StreamingTasteAtRisk:
+    """
+    Online TaR/CTaR estimator for a single quantile.
+
+    Feed it with chunks of taste drawings via `update` and read the estimate with `result`.
+    Memory is bounded by `tail_capacity + reservoir_size` values.
+    """
+
+    def __init__(
+        self,
+        quantile: float,
+        tail_capacity: int = 100_000,
+        reservoir_size: int = 100_000,
+        seed: int = 0,
+    ) -> None:
+        if not 0 < quantile < 1:
+            raise ValueError("The quantile has to be in the interval (0, 1)")
+        self.quantile = quantile
+        self.tail_capacity = tail_capacity
+        self.reservoir_size = reservoir_size
+        self.n_samples = 0
+        self._rng = np.random.default_rng(seed)
+        self._tail = np.empty(0)
+        self._reservoir = np.empty(0)
+        self._reservoir_keys = np.empty(0)
+
+    def update(self, taste: np.ndarray) -> None:
+        taste = np.asarray(taste, dtype=float).ravel()
+        self.n_samples += taste.size
+
+        tail = np.concatenate([self._tail, taste])
+        if tail.size > self.tail_capacity:
+            tail = np.partition(tail, self.tail_capacity - 1)[: self.tail_capacity]
+        self._tail = tail
+
+        keys = np.concatenate([self._reservoir_keys, self._rng.random(taste.size)])
+        reservoir = np.concatenate([self._reservoir, taste])
+        if keys.size > self.reservoir_size:
+            keep = np.argpartition(keys, self.reservoir_size - 1)[: self.reservoir_size]
+            keys, reservoir = keys[keep], reservoir[keep]
+        self._reservoir_keys, self._reservoir = keys, reservoir
+
+    def result(self) -> TasteAtRiskEstimate:
+        if self.n_samples == 0:
+            raise ValueError("No taste drawings were consumed yet")
+        n = self.n_samples
+        # np.percentile (linear method) interpolates between the order statistics lo and lo + 1
+        position = self.quantile * (n - 1)
+        lo = int(np.floor(position))
+        if min(lo + 2, n) <= self._tail.size:
+            tail = np.sort(self._tail)
+            hi = min(lo + 1, n - 1)
+            tar = tail[lo] + (position - lo) * (tail[hi] - tail[lo])
+            return TasteAtRiskEstimate(
+                taste_at_risk=float(tar),
+                conditional_taste_at_risk=float(np.mean(tail[tail <= tar])),
+                n_samples=n,
+                exact=True,
+            )
+        return self._approximate_result()
+
+    def _approximate_result(self) -> TasteAtRiskEstimate:
+        n, q = self.n_samples, self.quantile
+        sample = np.sort(self._reservoir)
+        m = sample.size
+        tar = float(np.percentile(sample, q * 100))
+        # distribution-free confidence interval of the quantile from the binomial order statistics
+        spread = _Z_95 * np.sqrt(m * q * (1 - q))
+        lower = sample[max(int(np.floor(q * m - spread)), 0)]
+        upper = sample[min(int(np.ceil(q * m + spread)), m - 1)]
+        tar_error = float(max(tar - lower, upper - tar))
+
+        # the exact tail covers the smallest drawings, the rest of the tail up to TaR is
+        # estimated from the sample scaled to the whole population
+        tail_max = self._tail.max()
+        between = sample[(sample > tail_max) & (sample <= tar)]
+        scale = n / m
+        count = self._tail.size + scale * between.size
+        total = self._tail.sum() + scale * between.sum()
+        ctar = total / count
+        # only the sampled part of the tail contributes to the error of the mean
+        ctar_error = 0.0
+        if between.size > 1:
+            ctar_error = float(
+                _Z_95 * scale * np.sqrt(between.size) * np.std(between, ddof=1) / count
+            )
+        return TasteAtRiskEstimate(
+            taste_at_risk=tar,
+            conditional_taste_at_risk=float(ctar),
+            n_samples=n,
+            exact=False,
+            taste_at_risk_error=tar_error,
+            conditional_taste_at_risk_error=ctar_error,
+        )
+
+
+def streaming_taste_at_risk(
+    item: Union[Pizza, PizzaMenu],
+    fat_chunks: Iterable[np.ndarray],
+    quantile: float,
+    **kwargs,
+) -> TasteAtRiskEstimate:
+    # fat_chunks yields (n_ingredients x chunk_size) fat drawings, e.g. INGREDIENT_CATALOG.fat_chunks(10_000)
+    weights = taste_weights(item)
+    estimator = StreamingTasteAtRisk(quantile, **kwargs)
+    for fat in fat_chunks:
+        estimator.update(weights @ fat)
+    return estimator.result()
@@ -3,11 +3,34 @@
 
 # TODO: define 2 risk measures for the pizza menu and implement them (1 - Taste at Risk (TaR), 2 - Conditional Taste at Risk (CTaR), also known as Expected Shorttaste (ES)
 
+from maestro_pizza_maker.ingredients import INGREDIENT_CATALOG
 from maestro_pizza_maker.pizza import Pizza
 from maestro_pizza_maker.pizza_menu import PizzaMenu
+from maestro_pizza_maker.sand_box.fat_generator import (
+    SAMPLING_METHODS,
+    FatDistribution,
+    inverse_normal_cdf,
+)
+
+from dataclasses import dataclass
+import math
+from typing import List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 
+
+def taste_weights(item: Union[Pizza, PizzaMenu]) -> np.array:
+    # vector of taste weights per catalog ingredient, taste(item) = taste_weights(item) @ fat
+    if isinstance(item, PizzaMenu):
+        return item.composition_matrix.sum(axis=0) * item.catalog.weights
+    return item.composition * item.catalog.weights
+
+
+def menu_taste(menu: PizzaMenu) -> np.array:
+    # taste of the whole menu is linear in the compositions, so it is computed from the summed composition at once
+    return taste_weights(menu) @ menu.catalog.fat
+
+
 def taste_at_risk_pizza(pizza: Pizza, quantile: float) -> float:
     # TODO: implement the taste at risk measure for a pizza
     # quantile is the quantile that we want to consider
@@ -20,20 +43,315 @@ def taste_at_risk_menu(menu: PizzaMenu, quantile: float) -> float:
     # TODO: implement the taste at risk measure for a menu
     # quantile is the quantile that we want to consider
     # Hint: the taste of the whole menu is the sum of the taste of all pizzas in the menu, or? ;)
-    return np.percentile(sum(pizza.taste for pizza in menu.pizzas),quantile*100)
+    return np.percentile(menu_taste(menu),quantile*100)
 
 
 def conditional_taste_at_risk_pizza(pizza: Pizza, quantile: float) -> float:
     # TODO: implement the conditional taste at risk measure for a pizza
     # quantile is the quantile that we want to consider
     # Hint: Simmilarity between the Conditional Taste at Risk and the Conditional Value at Risk is not a coincidence or is it?
-    return np.mean(pizza.taste[pizza.taste <=taste_at_risk_pizza(pizza, quantile)])
+    taste = pizza.taste
+    return np.mean(taste[taste <=taste_at_risk_pizza(pizza, quantile)])
     # return np.mean(pizza.taste[pizza.taste <=np.percentile(pizza.taste,quantile*100)])
 
 
 def conditional_taste_at_risk_menu(menu: PizzaMenu, quantile: float) -> float:
     # TODO: implement the conditional taste at risk measure for a menu
     # Hint: the taste of the whole menu is the sum of the taste of all pizzas in the menu, or? ;) (same as for the taste at risk)
-    menu_taste = sum(pizza.taste for pizza in menu.pizzas)
-    return np.mean(menu_taste[menu_taste<=taste_at_risk_menu(menu,quantile)])
+    taste = menu_taste(menu)
+    return np.mean(taste[taste<=np.percentile(taste,quantile*100)])
     # return np.mean(menu_taste[menu_taste<=np.percentile(menu_taste,quantile*100)])
+
+
+# risk report: TaR and CTaR of many pizzas/menus for many quantiles at once
+
+
+@dataclass
+class TasteRiskTable:
+    names: List[str]
+    quantiles: np.ndarray
+    # (n_items x n_quantiles) matrices
+    taste_at_risk: np.ndarray
+    conditional_taste_at_risk: np.ndarray
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        columns = pd.MultiIndex.from_product(
+            [["taste_at_risk", "conditional_taste_at_risk"], self.quantiles],
+            names=["measure", "quantile"],
+        )
+        return pd.DataFrame(
+            np.hstack([self.taste_at_risk, self.conditional_taste_at_risk]),
+            index=pd.Index(self.names, name="name"),
+            columns=columns,
+        )
+
+
+def taste_risk(
+    taste: np.ndarray, quantiles: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    TaR and CTaR of every row of `taste` (n_items x n_samples) for all the quantiles.
+
+    Every row is partitioned once around all the order statistics needed by the quantiles
+    (np.percentile's linear interpolation), the CTaRs then come from one cumulative sum.
+    Ties exactly at the quantile are counted once. Returns two (n_items x n_quantiles) arrays.
+    """
+    taste = np.atleast_2d(taste)
+    quantiles = np.asarray(quantiles, dtype=float)
+    n_samples = taste.shape[1]
+    positions = quantiles * (n_samples - 1)
+    lo = np.floor(positions).astype(int)
+    hi = np.minimum(lo + 1, n_samples - 1)
+    ordered = np.partition(taste, np.unique(np.concatenate([lo, hi])), axis=1)
+    tar = ordered[:, lo] + (positions - lo) * (ordered[:, hi] - ordered[:, lo])
+    # the lo + 1 smallest drawings sit in front of position lo after the partition
+    ctar = np.cumsum(ordered[:, : lo.max() + 1], axis=1)[:, lo] / (lo + 1)
+    return tar, ctar
+
+
+def taste_risk_table(
+    items: Sequence[Union[Pizza, PizzaMenu]],
+    quantiles: Sequence[float],
+    names: Optional[List[str]] = None,
+) -> TasteRiskTable:
+    # taste drawings of all the items (of one catalog) in one (n_items x n_samples) matmul
+    catalog = items[0].catalog if len(items) else INGREDIENT_CATALOG
+    taste = np.array([taste_weights(item) for item in items]).reshape(
+        len(items), len(catalog)
+    ) @ catalog.fat
+    tar, ctar = taste_risk(taste, quantiles)
+    if names is None:
+        names = [
+            item.name if isinstance(item, Pizza) else f"Menu {i}"
+            for i, item in enumerate(items)
+        ]
+    return TasteRiskTable(
+        names=names,
+        quantiles=np.asarray(quantiles, dtype=float),
+        taste_at_risk=tar,
+        conditional_taste_at_risk=ctar,
+    )
+
+
+# variance reduced estimates from fresh drawings of the fat distribution
+
+# sampling methods of the fat scenarios plus "importance" sampling of the lower tail
+SIMULATION_METHODS = SAMPLING_METHODS + ("importance",)
+
+
+def weighted_taste_risk(
+    taste: np.ndarray,
+    weights: np.ndarray,
+    quantiles: Sequence[float],
+    total_weight: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    TaR and CTaR of weighted drawings (e.g. the likelihood ratios of importance sampling).
+
+    TaR is the smallest drawing whose cumulative weight reaches quantile * total_weight, CTaR
+    the weighted mean of the drawings up to it. The total weight defaults to the sum of the
+    weights; likelihood ratios have the known expectation 1, so n_samples is the better (lower
+    variance) total there. `taste` and `weights` are (n_items x n_samples) (or broadcastable),
+    returns two (n_items x n_quantiles) arrays.
+    """
+    taste = np.atleast_2d(taste)
+    weights = np.broadcast_to(weights, taste.shape)
+    quantiles = np.asarray(quantiles, dtype=float)
+    order = np.argsort(taste, axis=1)
+    taste = np.take_along_axis(taste, order, axis=1)
+    weights = np.take_along_axis(weights, order, axis=1)
+    cumulative_weights = np.cumsum(weights, axis=1)
+    cumulative_taste = np.cumsum(weights * taste, axis=1)
+    total = cumulative_weights[:, -1:] if total_weight is None else total_weight
+    levels = quantiles[None, :] * total
+    positions = np.array(
+        [np.searchsorted(row, level) for row, level in zip(cumulative_weights, levels)]
+    ).clip(max=taste.shape[1] - 1)
+    tar = np.take_along_axis(taste, positions, axis=1)
+    ctar = np.take_along_axis(cumulative_taste, positions, axis=1) / np.take_along_axis(
+        cumulative_weights, positions, axis=1
+    )
+    return tar, ctar
+
+
+def simulated_taste_risk(
+    item: Union[Pizza, PizzaMenu],
+    quantiles: Sequence[float],
+    n_scenarios: int = 10_000,
+    method: str = "mc",
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    TaR and CTaR of the item for all the quantiles from n_scenarios new fat drawings.
+
+    The drawings come from the fat distribution of the catalog (see SIMULATION_METHODS):
+    antithetic, Latin hypercube and Sobol points reduce the variance of the whole distribution,
+    "importance" shifts the drawings into the lower tail of the taste of the item (at the
+    smallest quantile) and reweights them, which pays off for the extreme quantiles.
+    """
+    if method not in SIMULATION_METHODS:
+        raise ValueError(f"Unknown method {method}, use one of {SIMULATION_METHODS}")
+    weights = taste_weights(item)
+    distribution = item.catalog.fat_distribution()
+    rng = np.random.default_rng(seed)
+    if method == "importance":
+        shift = distribution.tail_shift(weights, min(quantiles))
+        fat, likelihood_ratios = distribution.importance_sample(n_scenarios, rng, shift)
+        tar, ctar = weighted_taste_risk(
+            weights @ fat, likelihood_ratios, quantiles, total_weight=n_scenarios
+        )
+    else:
+        taste = weights @ distribution.sample(n_scenarios, rng, method=method)
+        tar, ctar = taste_risk(taste, quantiles)
+    return tar[0], ctar[0]
+
+
+# parametric (Gaussian) risk: the fat is multivariate normal before clipping, so the taste of
+# any item is normal with mean w.mu and variance w' Sigma w and TaR/CTaR have closed forms
+
+
+def gaussian_taste_risk(
+    weights: np.ndarray, distribution: FatDistribution, quantiles: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closed-form TaR and CTaR of the tastes weights @ fat, fat ~ N(mean, cov) (clipping ignored).
+
+    TaR_q = m + s z_q and CTaR_q = m - s phi(z_q) / q with z_q the standard normal quantile.
+    `weights` is (n_items x n_ingredients), O(n_ingredients^2) per item, no scenarios involved.
+    Returns two (n_items x n_quantiles) arrays.
+    """
+    weights = np.atleast_2d(weights)
+    quantiles = np.asarray(quantiles, dtype=float)
+    mean = weights @ distribution.mean
+    std = np.sqrt(np.maximum(np.einsum("ij,jk,ik->i", weights, distribution.cov, weights), 0.0))
+    z = inverse_normal_cdf(quantiles)
+    tail = np.exp(-0.5 * z**2) / np.sqrt(2 * np.pi) / quantiles
+    tar = mean[:, None] + std[:, None] * z[None, :]
+    ctar = mean[:, None] - std[:, None] * tail[None, :]
+    return tar, ctar
+
+
+def _item_weights(items: Sequence[Union[Pizza, PizzaMenu]]):
+    catalog = items[0].catalog if len(items) else INGREDIENT_CATALOG
+    weights = np.array([taste_weights(item) for item in items]).reshape(len(items), len(catalog))
+    names = [item.name if isinstance(item, Pizza) else f"Menu {i}" for i, item in enumerate(items)]
+    return catalog, weights, names
+
+
+def gaussian_taste_risk_table(
+    items: Sequence[Union[Pizza, PizzaMenu]],
+    quantiles: Sequence[float],
+    names: Optional[List[str]] = None,
+) -> TasteRiskTable:
+    # parametric counterpart of taste_risk_table, e.g. gaussian_taste_risk_table(menu.pizzas, ...)
+    catalog, weights, default_names = _item_weights(items)
+    tar, ctar = gaussian_taste_risk(weights, catalog.fat_distribution(), quantiles)
+    return TasteRiskTable(
+        names=default_names if names is None else names,
+        quantiles=np.asarray(quantiles, dtype=float),
+        taste_at_risk=tar,
+        conditional_taste_at_risk=ctar,
+    )
+
+
+# normal quantile of the two-sided 95% confidence intervals
+_Z_95 = 1.959963984540054
+
+
+@dataclass
+class GaussianRiskDiagnostic:
+    gaussian: TasteRiskTable
+    empirical: TasteRiskTable
+    # (n_items x n_quantiles) relative differences (gaussian - empirical) / |empirical|
+    taste_at_risk_error: np.ndarray
+    conditional_taste_at_risk_error: np.ndarray
+    # (n_items x n_quantiles) standard errors of the empirical estimates (Monte Carlo noise)
+    taste_at_risk_standard_error: np.ndarray
+    conditional_taste_at_risk_standard_error: np.ndarray
+    # probability that any ingredient of the item is clipped in a scenario (union bound)
+    clipping_probability: np.ndarray
+    # items that are clipped and whose Gaussian TaR/CTaR differ from the empirical ones by more
+    # than the tolerance plus the noise of the empirical estimates
+    inaccurate: np.ndarray
+
+
+def gaussian_risk_diagnostic(
+    items: Sequence[Union[Pizza, PizzaMenu]],
+    quantiles: Sequence[float],
+    tolerance: float = 0.02,
+    clipping_tolerance: float = 1e-3,
+    distribution: Optional[FatDistribution] = None,
+    n_scenarios: int = 10_000,
+    seed: int = 0,
+) -> GaussianRiskDiagnostic:
+    """
+    Compares the Gaussian TaR/CTaR with the empirical ones to flag where clipping breaks them.
+
+    The fat drawings are clipped from below, which the closed forms ignore. Without clipping
+    they are exact, so an item is only flagged if its clipping probability exceeds
+    `clipping_tolerance` and a relative difference exceeds `tolerance` plus the 95% noise band of
+    the empirical estimate. The empirical estimates use the catalog scenarios, or n_scenarios
+    fresh drawings if another `distribution` is given.
+    """
+    catalog, weights, names = _item_weights(items)
+    quantiles = np.asarray(quantiles, dtype=float)
+    if distribution is None:
+        distribution = catalog.fat_distribution()
+        fat = catalog.fat
+    else:
+        fat = distribution.sample(n_scenarios, np.random.default_rng(seed))
+    taste = weights @ fat
+    n = taste.shape[1]
+    gaussian_tar, gaussian_ctar = gaussian_taste_risk(weights, distribution, quantiles)
+    tar, ctar = taste_risk(taste, quantiles)
+
+    # asymptotic standard errors: the quantile through the (Gaussian) density at it, the tail
+    # mean from the variance of the tail drawings
+    ordered = np.sort(taste, axis=1)
+    tail_variance = np.stack(
+        [ordered[:, : int(np.floor(q * (n - 1))) + 1].var(axis=1) for q in quantiles],
+        axis=1,
+    )
+    std = np.sqrt(np.maximum(np.einsum("ij,jk,ik->i", weights, distribution.cov, weights), 0.0))
+    z = inverse_normal_cdf(quantiles)
+    density = np.exp(-0.5 * z**2) / np.sqrt(2 * np.pi)
+    tar_standard_error = std[:, None] * np.sqrt(quantiles * (1 - quantiles) / n) / density
+    ctar_standard_error = np.sqrt(
+        (tail_variance + (1 - quantiles) * (tar - ctar) ** 2) / (quantiles * n)
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tar_error = (gaussian_tar - tar) / np.abs(tar)
+        ctar_error = (gaussian_ctar - ctar) / np.abs(ctar)
+    tar_off = np.abs(gaussian_tar - tar) > tolerance * np.abs(tar) + _Z_95 * tar_standard_error
+    ctar_off = np.abs(gaussian_ctar - ctar) > (
+        tolerance * np.abs(ctar) + _Z_95 * ctar_standard_error
+    )
+
+    marginal_std = np.sqrt(np.diag(distribution.cov))
+    below = np.array(
+        [
+            _normal_cdf((distribution.clip_min - mean) / s)
+            if s > 0
+            else float(mean < distribution.clip_min)
+            for mean, s in zip(distribution.mean, marginal_std)
+        ]
+    )
+    clipping_probability = np.minimum((weights != 0) @ below, 1.0)
+    inaccurate = (clipping_probability > clipping_tolerance) & np.any(tar_off | ctar_off, axis=1)
+    return GaussianRiskDiagnostic(
+        gaussian=TasteRiskTable(names, quantiles, gaussian_tar, gaussian_ctar),
+        empirical=TasteRiskTable(names, quantiles, tar, ctar),
+        taste_at_risk_error=tar_error,
+        conditional_taste_at_risk_error=ctar_error,
+        taste_at_risk_standard_error=tar_standard_error,
+        conditional_taste_at_risk_standard_error=ctar_standard_error,
+        clipping_probability=clipping_probability,
+        inaccurate=inaccurate,
+    )
+
+
+def _normal_cdf(x: float) -> float:
+    return 0.5 * math.erfc(-x / math.sqrt(2))
@@ -0,0 +1,133 @@
+# Attribution of the menu Conditional Taste at Risk (CTaR) to the pizzas and the ingredients.
+# The menu taste is the sum of the pizza tastes, so the CTaR (the mean menu taste over the tail
+# scenarios) splits exactly into the means of the pizza tastes over the same scenarios (Euler
+# allocation). All the contributions come from one pass over the tail scenario set: the mean fat
+# of every ingredient in the tail, weighted by the compositions.
+# The what-if queries (adding/removing a pizza) reuse the cached menu taste vector and cost one
+# pizza taste plus one partition of the scenarios instead of a recomputation of the menu.
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.pizza_menu import PizzaMenu
+from maestro_pizza_maker.taste_at_risk import menu_taste, taste_risk, taste_weights
+
+# pizzas per block of the vectorized removal effects, bounds the (block x n_scenarios) matrix
+_BLOCK_SIZE = 256
+
+
+def tail_scenarios(taste: np.ndarray, quantile: float) -> np.ndarray:
+    # indices of the lo + 1 smallest drawings, the scenarios averaged by the CTaR of taste_risk
+    lo = int(np.floor(quantile * (taste.size - 1)))
+    return np.argpartition(taste, lo)[: lo + 1]
+
+
+@dataclass
+class TasteRiskAttribution:
+    quantile: float
+    taste_at_risk: float
+    conditional_taste_at_risk: float
+    # Euler contributions to the CTaR, each of the vectors sums to conditional_taste_at_risk
+    pizzas: np.ndarray
+    # per catalog ingredient (catalog order), zero for the ingredients not on the menu
+    ingredients: np.ndarray
+    pizza_names: List[str]
+    ingredient_names: List[str]
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.Series(
+            self.pizzas, index=pd.Index(self.pizza_names, name="pizza"), name="ctar_contribution"
+        )
+
+
+class MenuRiskAttribution:
+    """
+    CTaR contributions and incremental what-if queries for a menu at one quantile.
+
+    The menu taste drawings are computed once; `add_pizza`/`remove_pizza` keep them (and the
+    menu) up to date. Changes made to the menu directly are not seen, call `refresh` after them.
+    """
+
+    def __init__(self, menu: PizzaMenu, quantile: float) -> None:
+        if not 0 < quantile < 1:
+            raise ValueError("The quantile has to be in the interval (0, 1)")
+        self.menu = menu
+        self.quantile = quantile
+        self.refresh()
+
+    def refresh(self) -> None:
+        self.taste = menu_taste(self.menu)
+
+    def _risk(self, taste: np.ndarray) -> Tuple[float, float]:
+        tar, ctar = taste_risk(taste, [self.quantile])
+        return float(tar[0, 0]), float(ctar[0, 0])
+
+    def _pizza_taste(self, pizza: Pizza) -> np.ndarray:
+        if pizza.catalog is not self.menu.catalog:
+            raise ValueError(
+                f"The pizza {pizza.name} is not made of the ingredients of the menu catalog."
+            )
+        return taste_weights(pizza) @ self.menu.catalog.fat
+
+    def risk(self) -> Tuple[float, float]:
+        # (TaR, CTaR) of the menu
+        return self._risk(self.taste)
+
+    def attribution(self) -> TasteRiskAttribution:
+        catalog = self.menu.catalog
+        tail = tail_scenarios(self.taste, self.quantile)
+        tail_fat = catalog.fat[:, tail].mean(axis=1)
+        tar, ctar = self.risk()
+        return TasteRiskAttribution(
+            quantile=self.quantile,
+            taste_at_risk=tar,
+            conditional_taste_at_risk=ctar,
+            pizzas=(self.menu.composition_matrix * catalog.weights) @ tail_fat,
+            ingredients=taste_weights(self.menu) * tail_fat,
+            pizza_names=[pizza.name for pizza in self.menu.pizzas],
+            ingredient_names=list(catalog.keys),
+        )
+
+    def with_pizza(self, pizza: Pizza) -> Tuple[float, float]:
+        # (TaR, CTaR) of the menu if the pizza was added, the menu is not changed
+        return self._risk(self.taste + self._pizza_taste(pizza))
+
+    def without_pizza(self, pizza: Pizza) -> Tuple[float, float]:
+        # (TaR, CTaR) of the menu if the pizza was removed, the menu is not changed
+        if pizza not in self.menu:
+            raise ValueError("The pizza, you want to remove, is not an element of the menu.")
+        return self._risk(self.taste - self._pizza_taste(pizza))
+
+    def removal_effects(self) -> np.ndarray:
+        """
+        CTaR change of removing each of the pizzas (one at a time), in menu order.
+
+        The menu tastes without every pizza are evaluated in blocks of pizzas, O(n_pizzas x
+        n_scenarios) in total instead of a menu recomputation per pizza.
+        """
+        catalog = self.menu.catalog
+        weights = self.menu.composition_matrix * catalog.weights
+        _, ctar = self.risk()
+        effects = np.empty(len(weights))
+        for start in range(0, len(weights), _BLOCK_SIZE):
+            block = weights[start : start + _BLOCK_SIZE]
+            _, block_ctar = taste_risk(self.taste - block @ catalog.fat, [self.quantile])
+            effects[start : start + len(block)] = block_ctar[:, 0] - ctar
+        return effects
+
+    def add_pizza(self, pizza: Pizza) -> None:
+        self.menu.add_pizza(pizza)
+        self.taste = self.taste + self._pizza_taste(pizza)
+
+    def remove_pizza(self, pizza: Pizza) -> None:
+        self.menu.remove_pizza(pizza)
+        self.taste = self.taste - self._pizza_taste(pizza)
+
+
+def menu_risk_attribution(menu: PizzaMenu, quantile: float) -> TasteRiskAttribution:
+    return MenuRiskAttribution(menu, quantile).attribution()
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from maestro_pizza_maker.sand_box.fat_generator import FatDistribution, FatScenarioStore, generate_scenarios
+
+
+class TestFatScenarioStore(unittest.TestCase):
+
+    def test_store_is_seeded_and_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = FatScenarioStore(dim=4, n_simulations=50, seed=1, directory=directory)
+            simulations = store.load()
+            self.assertTrue(store.path.exists())
+            self.assertIsInstance(simulations, np.memmap)
+            self.assertEqual(simulations.shape, (4, 50))
+            np.testing.assert_array_equal(simulations, store.generate())
+            np.testing.assert_array_equal(store.load(), simulations)
+            self.assertFalse(np.array_equal(FatScenarioStore(dim=4, n_simulations=50, seed=2, directory=directory).load(), simulations))
+
+    def test_chunked_generation(self):
+        distribution = FatDistribution.random(5, np.random.default_rng(0))
+        np.testing.assert_allclose(distribution.cholesky @ distribution.cholesky.T, distribution.cov)
+        scenarios = generate_scenarios(distribution, 20_000, seed=3, chunk_size=3_000)
+        self.assertEqual(scenarios.shape, (5, 20_000))
+        self.assertTrue(np.all(scenarios >= distribution.clip_min))
+        np.testing.assert_allclose(scenarios.mean(axis=1), distribution.mean, atol=0.1 * np.sqrt(np.diag(distribution.cov)).max())
+        buffer = np.zeros((5, 20_000))
+        generate_scenarios(distribution, 20_000, seed=3, chunk_size=3_000, out=buffer)
+        np.testing.assert_array_equal(buffer, scenarios)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "scenarios.npy")
+            generate_scenarios(distribution, 20_000, seed=3, chunk_size=3_000, out=path, n_jobs=2)
+            np.testing.assert_array_equal(np.load(path), scenarios)
+
+if __name__ == '__main__':
+    unittest.main()
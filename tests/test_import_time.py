@@ -0,0 +1,33 @@
+"""Import-time budget of the lightweight part of the package."""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# wall-clock budget of `import maestro_pizza_maker.pizza` in a fresh interpreter (numpy included)
+IMPORT_BUDGET_SECONDS = 1.0
+HEAVY_MODULES = ["pandas", "sklearn", "mip", "scipy"]
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import maestro_pizza_maker.pizza
+import maestro_pizza_maker.pizza_menu
+import maestro_pizza_maker.pizza_optimizer
+import maestro_pizza_maker.pizza_sensitivities
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def test_import_is_lazy_and_within_budget() -> None:
+    output = subprocess.run(
+        [sys.executable, "-c", _SCRIPT],
+        cwd=Path(__file__).resolve().parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    assert result["loaded"] == []
+    assert result["elapsed"] < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,140 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import (
+    INGREDIENT_CATALOG,
+    IngredientCatalog,
+    IngredientType,
+    PizzaIngredients,
+    load_catalog,
+    save_catalog,
+)
+from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.pizza_menu import PizzaMenu
+from maestro_pizza_maker.pizza_optimizer import (
+    PizzaConstraintsIngredients,
+    PizzaConstraintsValues,
+    PizzaOptimizer,
+    ValueBounds,
+)
+from maestro_pizza_maker.taste_at_risk import taste_at_risk_pizza
+
+
+def _random_catalog(n_per_type, n_simulations=200, seed=0):
+    rng = np.random.default_rng(seed)
+    types = [
+        ingredient_type for ingredient_type in IngredientType for _ in range(n_per_type)
+    ]
+    return IngredientCatalog.from_columns(
+        keys=[f"{ingredient_type.name}_{i}" for i, ingredient_type in enumerate(types)],
+        types=types,
+        nutrients=rng.uniform(0.5, 50, size=(len(types), 4)),
+        fat=rng.uniform(1, 30, size=(len(types), n_simulations)),
+    )
+
+
+class TestIngredientCatalog(unittest.TestCase):
+    def setUp(self):
+        self.catalog = load_catalog()
+
+    def test_data_file_matches_the_enum(self):
+        np.testing.assert_array_equal(
+            self.catalog.nutrients, INGREDIENT_CATALOG.nutrients
+        )
+        self.assertEqual(self.catalog.types, INGREDIENT_CATALOG.types)
+        self.assertEqual(self.catalog.fingerprint, INGREDIENT_CATALOG.fingerprint)
+        ham = self.catalog["HAM"]
+        self.assertIs(self.catalog[PizzaIngredients.HAM.value.name], ham)
+        self.assertEqual(ham.value.price, PizzaIngredients.HAM.value.price)
+        self.assertEqual(ham.value.type, IngredientType.MEAT)
+        np.testing.assert_array_equal(ham.value.fat, PizzaIngredients.HAM.value.fat)
+
+    def test_pizza_of_a_loaded_catalog(self):
+        pizza = Pizza(
+            dough=PizzaIngredients.THIN_DOUGH,
+            sauce=PizzaIngredients.TOMATO_SAUCE,
+            cheese=[PizzaIngredients.CHEDDAR],
+            meat=[PizzaIngredients.HAM],
+        )
+        loaded = Pizza(
+            dough=self.catalog["THIN_DOUGH"],
+            sauce=self.catalog["TOMATO_SAUCE"],
+            cheese=[self.catalog["CHEDDAR"]],
+            meat=[self.catalog["HAM"]],
+        )
+        self.assertIs(loaded.catalog, self.catalog)
+        self.assertEqual(loaded.name, pizza.name)
+        self.assertAlmostEqual(loaded.price, pizza.price)
+        np.testing.assert_allclose(loaded.taste, pizza.taste)
+        self.assertAlmostEqual(
+            taste_at_risk_pizza(loaded, 0.05), taste_at_risk_pizza(pizza, 0.05)
+        )
+        self.assertNotEqual(loaded.compact, pizza.compact)
+        self.assertEqual(pickle.loads(pickle.dumps(pizza.compact)), pizza.compact)
+        menu = PizzaMenu(pizzas=[loaded])
+        self.assertIs(menu.catalog, self.catalog)
+        with self.assertRaises(ValueError):
+            menu.add_pizza(pizza)
+
+    def test_pickle(self):
+        for catalog in [self.catalog, _random_catalog(2)]:
+            loaded = pickle.loads(pickle.dumps(catalog))
+            self.assertEqual(loaded.fingerprint, catalog.fingerprint)
+            self.assertIs(loaded.ingredients[0].catalog, loaded)
+            np.testing.assert_array_equal(loaded.fat, catalog.fat)
+
+    def test_fingerprint_covers_types_and_names(self):
+        columns = self.catalog.columns()
+        types = list(columns["type"])
+        types[0], types[-1] = types[-1], types[0]
+        swapped = IngredientCatalog.from_columns(
+            keys=columns["key"], types=types, nutrients=self.catalog.nutrients
+        )
+        self.assertNotEqual(swapped.fingerprint, self.catalog.fingerprint)
+        renamed = IngredientCatalog.from_columns(
+            keys=columns["key"],
+            types=columns["type"],
+            nutrients=self.catalog.nutrients,
+            names=["X" + name for name in self.catalog.names],
+        )
+        self.assertNotEqual(renamed.fingerprint, self.catalog.fingerprint)
+
+    def test_npz_round_trip(self):
+        catalog = _random_catalog(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = save_catalog(
+                catalog, os.path.join(directory, "catalog.npz"), include_fat=True
+            )
+            loaded = load_catalog(path)
+        self.assertEqual(loaded.keys, catalog.keys)
+        np.testing.assert_array_equal(loaded.fat, catalog.fat)
+        self.assertEqual(loaded.fingerprint, catalog.fingerprint)
+
+    def test_optimizer_on_a_larger_catalog(self):
+        catalog = _random_catalog(8)
+        constraints_values = PizzaConstraintsValues(
+            calories=ValueBounds(min=50, max=200)
+        )
+        constraints_ingredients = PizzaConstraintsIngredients(
+            cheese=1, meat=2, vegetables=1
+        )
+        pizzas = [
+            PizzaOptimizer(
+                backend=backend, catalog=catalog
+            ).maximize_taste_penalty_price(
+                constraints_values, constraints_ingredients, 0.1
+            )
+            for backend in ["mip", "enumeration"]
+        ]
+        self.assertEqual(pizzas[0].name, pizzas[1].name)
+        self.assertIs(pizzas[0].catalog, catalog)
+        self.assertTrue(50 <= pizzas[0].calories <= 200)
+        self.assertEqual(len(PizzaMenu(pizzas=pizzas[:1])), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import INGREDIENT_CATALOG, IngredientCatalog, load_catalog
+from maestro_pizza_maker.optimizer_cache import OptimizerCache
+from maestro_pizza_maker.pizza_optimizer import (
+    InfeasiblePizzaError,
+    PizzaConstraintsIngredients,
+    PizzaConstraintsValues,
+    PizzaOptimizer,
+    ValueBounds,
+    maximize_taste_penalty_price,
+    minimize_price,
+)
+
+
+class TestOptimizerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.constraints_values = PizzaConstraintsValues(calories=ValueBounds(min=500, max=np.inf))
+        self.constraints_ingredients = PizzaConstraintsIngredients(cheese=1, meat=1, vegetables=2)
+
+    def test_hits_and_misses(self):
+        cache = OptimizerCache(maxsize=2)
+        pizza = cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+        self.assertEqual(pizza.name, minimize_price(self.constraints_values, self.constraints_ingredients).name)
+        # equal constraints with other number types hit the same entry
+        same = PizzaConstraintsValues(calories=ValueBounds(min=np.float64(500.0), max=float("inf")))
+        self.assertEqual(cache.minimize_price(same, self.constraints_ingredients).name, pizza.name)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 1))
+        self.assertEqual(
+            cache.maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, 0.5).name,
+            maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, 0.5).name,
+        )
+        infeasible = PizzaConstraintsValues(calories=ValueBounds(max=1))
+        for _ in range(2):
+            with self.assertRaises(InfeasiblePizzaError):
+                cache.minimize_price(infeasible, self.constraints_ingredients)
+        self.assertEqual((cache.stats.hits, cache.stats.misses, cache.stats.evictions, cache.stats.size), (2, 3, 1, 2))
+
+    def test_invalidated_by_the_catalog(self):
+        cache = OptimizerCache(PizzaOptimizer())
+        cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+        # the same data loaded from the file has the same fingerprint
+        cache.optimizer = PizzaOptimizer(catalog=load_catalog())
+        cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 1))
+        columns = INGREDIENT_CATALOG.columns()
+        catalog = IngredientCatalog.from_columns(
+            keys=columns["key"], types=columns["type"], nutrients=INGREDIENT_CATALOG.nutrients * 2
+        )
+        cache.optimizer = PizzaOptimizer(catalog=catalog)
+        pizza = cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+        self.assertIs(pizza.catalog, catalog)
+        self.assertEqual((cache.stats.hits, cache.stats.misses, cache.stats.size), (1, 2, 1))
+
+    def test_invalidated_by_the_ingredient_types(self):
+        # cheese and meat share their taste weight, only the types tell the catalogs apart
+        cache = OptimizerCache(PizzaOptimizer())
+        cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+        columns = INGREDIENT_CATALOG.columns()
+        types = list(columns["type"])
+        cheese, meat = types.index("cheese"), types.index("meat")
+        types[cheese], types[meat] = types[meat], types[cheese]
+        catalog = IngredientCatalog.from_columns(keys=columns["key"], types=types, nutrients=INGREDIENT_CATALOG.nutrients)
+        cache.optimizer = PizzaOptimizer(catalog=catalog)
+        pizza = cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+        self.assertEqual(cache.stats.misses, 2)
+        self.assertEqual((len(pizza.cheese), len(pizza.meat)), (1, 1))
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.sqlite")
+            cache = OptimizerCache(path=path)
+            pizza = cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+            cache.close()
+            cache = OptimizerCache(path=path)
+            self.assertEqual(cache.minimize_price(self.constraints_values, self.constraints_ingredients).name, pizza.name)
+            self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 0))
+            cache.clear()
+            cache.minimize_price(self.constraints_values, self.constraints_ingredients)
+            self.assertEqual(cache.stats.misses, 1)
+            cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
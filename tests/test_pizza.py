@@ -1,5 +1,9 @@
 import unittest
-from maestro_pizza_maker.pizza import Pizza
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import PizzaIngredients
+from maestro_pizza_maker.pizza import CompactPizza, Pizza
 
 
 class TestPizzaMethods(unittest.TestCase):
@@ -22,8 +26,42 @@ class TestPizzaMethods(unittest.TestCase):
                   fruits=[PizzaIngredients.APPLE],
                   vegetables = [PizzaIngredients.ONIONS])
         # taste = 0.05 * fat_dough + 0.2 * fat_sauce + 0.3 * fat_cheese + 0.1 * fat_fruits + 0.3 * fat_meat + 0.05 * fat_vegetables
-        pizza_taste = 0.05*pizza.dough.value.fat + 0.2*pizza.sauce.value.fat + 0.3*pizza.cheese[0].value.fat+0.1*pizza.fruits[0].value.fat+0.3*pizza.meat[0].value.fat+0.05*pizza.vegeatables[0].value.fat
-        self.assertEqual(pizza.taste,pizza_taste)
+        pizza_taste = 0.05*pizza.dough.value.fat + 0.2*pizza.sauce.value.fat + 0.3*pizza.cheese[0].value.fat+0.1*pizza.fruits[0].value.fat+0.3*pizza.meat[0].value.fat+0.05*pizza.vegetables[0].value.fat
+        np.testing.assert_allclose(pizza.taste, pizza_taste)
+
+    def test_nutrients_match_ingredients(self):
+        pizza = Pizza(dough = PizzaIngredients.THIN_DOUGH,
+                  sauce=PizzaIngredients.CREAM_SAUCE,
+                  cheese = [PizzaIngredients.MOZZARELA, PizzaIngredients.MOZZARELA],
+                  meat = [PizzaIngredients.BACON])
+        for nutrient in ["price", "protein", "carbohydrates", "calories"]:
+            expected = sum(getattr(ingredient.value, nutrient) for ingredient in pizza.ingredients)
+            self.assertAlmostEqual(getattr(pizza, nutrient), expected)
+        np.testing.assert_allclose(pizza.fat, sum(ingredient.value.fat for ingredient in pizza.ingredients))
+
+    def test_cached_taste_invalidated_on_mutation(self):
+        pizza = Pizza(dough = PizzaIngredients.CLASSIC_DOUGH,
+                  sauce=PizzaIngredients.TOMATO_SAUCE)
+        self.assertIs(pizza.taste, pizza.taste)
+        pizza.cheese.append(PizzaIngredients.CHEDDAR)
+        np.testing.assert_allclose(pizza.taste, 0.05*PizzaIngredients.CLASSIC_DOUGH.value.fat + 0.2*PizzaIngredients.TOMATO_SAUCE.value.fat + 0.3*PizzaIngredients.CHEDDAR.value.fat)
+        pizza.dough = PizzaIngredients.THIN_DOUGH
+        self.assertAlmostEqual(pizza.average_fat, sum(ingredient.value.fat.mean() for ingredient in pizza.ingredients))
+
+    def test_compact_pizza(self):
+        pizza = Pizza(dough = PizzaIngredients.CLASSIC_DOUGH,
+                  sauce=PizzaIngredients.TOMATO_SAUCE,
+                  cheese = [PizzaIngredients.CHEDDAR, PizzaIngredients.MOZZARELA, PizzaIngredients.MOZZARELA])
+        same_pizza = Pizza(dough = PizzaIngredients.CLASSIC_DOUGH,
+                  sauce=PizzaIngredients.TOMATO_SAUCE,
+                  cheese = [PizzaIngredients.MOZZARELA, PizzaIngredients.CHEDDAR, PizzaIngredients.MOZZARELA])
+        self.assertEqual(pizza.compact, same_pizza.compact)
+        self.assertEqual(len({pizza.compact, same_pizza.compact}), 1)
+        self.assertEqual(pizza.name, same_pizza.name)
+        self.assertEqual(pizza.compact.to_pizza().name, pizza.name)
+        self.assertAlmostEqual(pizza.compact.to_pizza().price, pizza.price)
+        with self.assertRaises(AttributeError):
+            pizza.compact.code = 0
 
 if __name__ == '__main__':
     unittest.main()
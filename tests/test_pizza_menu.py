@@ -1,34 +1,135 @@
+import random
 import unittest
 
+import numpy as np
+
+from maestro_pizza_maker.ingredients import PizzaIngredients
 from maestro_pizza_maker.pizza import Pizza
 from maestro_pizza_maker.pizza_menu import PizzaMenu
 
 class TestPizzaMenuMethods(unittest.TestCase):
 
     def setUp(self):
-        pizza1 = Pizza(sauce=PizzaIngredients.CREAM_SAUCE, dough=PizzaIngredients.CLASSIC_DOUGH)
-        pizza2 = Pizza(dough = PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, cheese = [PizzaIngredients.MOZZARELA])
-        pizza3 = Pizza(dough = PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese = [PizzaIngredients.CHEDDAR], meat = [PizzaIngredients.HAM],  vegetables = [PizzaIngredients.MUSHROOMS])
-        pizza4 = Pizza(dough = PizzaIngredients.CLASSIC_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese = [PizzaIngredients.MOZZARELA],  vegetables = [PizzaIngredients.ONIONS, PizzaIngredients.PEPPER])
-        pizza5 = Pizza(dough = PizzaIngredients.WHOLEMEAL_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, cheese = [PizzaIngredients.PARMESAN], fruits=[PizzaIngredients.APPLE], vegetables = [PizzaIngredients.ONIONS])
-        
-        pizza_menu = PizzaMenu(pizzas=[pizza1,pizza2,pizza3,pizza4])
-        pass
+        self.pizza1 = Pizza(sauce=PizzaIngredients.CREAM_SAUCE, dough=PizzaIngredients.CLASSIC_DOUGH)
+        self.pizza2 = Pizza(dough = PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, cheese = [PizzaIngredients.MOZZARELA])
+        self.pizza3 = Pizza(dough = PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese = [PizzaIngredients.CHEDDAR], meat = [PizzaIngredients.HAM],  vegetables = [PizzaIngredients.MUSHROOMS])
+        self.pizza4 = Pizza(dough = PizzaIngredients.CLASSIC_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese = [PizzaIngredients.MOZZARELA],  vegetables = [PizzaIngredients.ONIONS, PizzaIngredients.PEPPER])
+        self.pizza5 = Pizza(dough = PizzaIngredients.WHOLEMEAL_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, cheese = [PizzaIngredients.PARMESAN], fruits=[PizzaIngredients.APPLE], vegetables = [PizzaIngredients.ONIONS])
         
+        self.pizza_menu = PizzaMenu(pizzas=[self.pizza1,self.pizza2,self.pizza3,self.pizza4])
+
     def test_len(self):
-        self.asserEqual(len(pizza_menu),4)
+        self.assertEqual(len(self.pizza_menu),4)
 
     def test_add_pizza(self):
-        pizza_menu.add_pizza(pizza5)
-        self.assertEqual(len(pizza_menu),5)
+        self.pizza_menu.add_pizza(self.pizza5)
+        self.assertEqual(len(self.pizza_menu),5)
 
     def test_remove_pizza(self):
-        pizza_menu.remove_pizza(pizza1)
-        self.assertEqual(len(pizza_menu),4)
-        pizza_menu.add_pizza(pizza1)
+        self.pizza_menu.remove_pizza(self.pizza1)
+        self.assertEqual(len(self.pizza_menu),3)
+        self.pizza_menu.add_pizza(self.pizza1)
 
     def test_cheapest_pizza(self):
-        self.assertEqual(pizza_menu.cheapest_pizza,pizza1)
+        self.assertEqual(self.pizza_menu.cheapest_pizza,self.pizza1)
+
+    def test_batch_matches_pizzas(self):
+        batch = self.pizza_menu.batch
+        for attribute in ["price", "protein", "carbohydrates", "calories", "average_fat"]:
+            np.testing.assert_allclose(getattr(batch, attribute), [getattr(pizza, attribute) for pizza in self.pizza_menu.pizzas])
+        np.testing.assert_allclose(batch.taste, [pizza.taste for pizza in self.pizza_menu.pizzas])
+
+    def test_to_dataframe(self):
+        df = self.pizza_menu.to_dataframe(sort_by="price", descendent=True)
+        self.assertEqual(len(df), 4)
+        self.assertEqual(df["price"].iloc[0], self.pizza_menu.most_expensive_pizza.price)
+
+    def test_get_most_fat_pizza(self):
+        expected = max(self.pizza_menu.pizzas, key=lambda pizza: np.percentile(pizza.fat, 90))
+        self.assertIs(self.pizza_menu.get_most_fat_pizza(0.9), expected)
+
+    def test_contains(self):
+        self.assertIn(Pizza(sauce=PizzaIngredients.CREAM_SAUCE, dough=PizzaIngredients.CLASSIC_DOUGH), self.pizza_menu)
+        self.assertNotIn(self.pizza5, self.pizza_menu)
+        with self.assertRaises(ValueError):
+            self.pizza_menu.remove_pizza(self.pizza5)
+
+    def test_remove_pizza_keeps_index(self):
+        self.pizza_menu.add_pizza(self.pizza5)
+        self.pizza_menu.remove_pizza(self.pizza2)
+        self.pizza_menu.remove_pizza(self.pizza1)
+        self.assertEqual(sorted(pizza.name for pizza in self.pizza_menu.pizzas), sorted(pizza.name for pizza in [self.pizza3, self.pizza4, self.pizza5]))
+        for pizza in [self.pizza3, self.pizza4, self.pizza5]:
+            self.pizza_menu.remove_pizza(pizza)
+        self.assertEqual(len(self.pizza_menu), 0)
+
+    def test_duplicates(self):
+        menu = PizzaMenu(pizzas=[self.pizza1], allow_duplicates=False)
+        with self.assertRaises(ValueError):
+            menu.add_pizza(Pizza(sauce=PizzaIngredients.CREAM_SAUCE, dough=PizzaIngredients.CLASSIC_DOUGH))
+        self.pizza_menu.add_pizza(self.pizza1)
+        self.pizza_menu.remove_pizza(self.pizza1)
+        self.assertIn(self.pizza1, self.pizza_menu)
+
+    def test_extrema_follow_edits(self):
+        rng = random.Random(0)
+        candidates = [self.pizza1, self.pizza2, self.pizza3, self.pizza4, self.pizza5]
+        for _ in range(200):
+            if len(self.pizza_menu) > 1 and rng.random() < 0.5:
+                self.pizza_menu.remove_pizza(rng.choice(self.pizza_menu.pizzas))
+            else:
+                self.pizza_menu.add_pizza(rng.choice(candidates))
+            pizzas = self.pizza_menu.pizzas
+            self.assertEqual(self.pizza_menu.cheapest_pizza.price, min(pizza.price for pizza in pizzas))
+            self.assertEqual(self.pizza_menu.most_expensive_pizza.price, max(pizza.price for pizza in pizzas))
+            self.assertEqual(self.pizza_menu.most_caloric_pizza.calories, max(pizza.calories for pizza in pizzas))
+            self.assertEqual(self.pizza_menu.fewest_calories_pizza.calories, min(pizza.calories for pizza in pizzas))
+            self.assertEqual(self.pizza_menu.most_protein_pizza.protein, max(pizza.protein for pizza in pizzas))
+            self.assertIn(self.pizza_menu.cheapest_pizza, pizzas)
+
+    def test_extrema_of_pizzas_changed_in_place(self):
+        expensive = self.pizza_menu.most_expensive_pizza
+        expensive.cheese, expensive.meat, expensive.vegetables = [], [], []
+        self.assertEqual(self.pizza_menu.most_expensive_pizza.price, max(pizza.price for pizza in self.pizza_menu.pizzas))
+        self.pizza1.vegetables = [PizzaIngredients.ONIONS] * 4
+        self.pizza_menu.reindex()
+        self.assertIs(self.pizza_menu.most_expensive_pizza, self.pizza1)
+
+    def test_direct_edits_of_pizzas(self):
+        self.pizza_menu.pizzas = [self.pizza5, self.pizza2, self.pizza3, self.pizza4]
+        self.assertNotIn(self.pizza1, self.pizza_menu)
+        self.assertIn(self.pizza5, self.pizza_menu)
+        self.pizza_menu.pizzas[0] = self.pizza1
+        self.assertIn(self.pizza1, self.pizza_menu)
+        self.assertNotIn(self.pizza5, self.pizza_menu)
+        with self.assertRaises(ValueError):
+            self.pizza_menu.remove_pizza(self.pizza5)
+        self.pizza_menu.remove_pizza(self.pizza1)
+        self.assertEqual(len(self.pizza_menu), 3)
+        self.assertNotIn(self.pizza1, self.pizza_menu)
+
+    def test_pizzas_is_a_copy(self):
+        pizzas = [self.pizza1, self.pizza2]
+        menu = PizzaMenu(pizzas=pizzas)
+        pizzas.append(self.pizza3)
+        self.assertEqual(len(menu), 2)
+        self.assertNotIn(self.pizza3, menu)
+
+    def test_remove_pizza_moves_the_last_pizza(self):
+        self.pizza_menu.remove_pizza(self.pizza2)
+        self.assertEqual(self.pizza_menu.pizzas, [self.pizza1, self.pizza4, self.pizza3])
+        self.pizza_menu.remove_pizza(self.pizza3)
+        self.assertEqual(self.pizza_menu.pizzas, [self.pizza1, self.pizza4])
+
+    def test_pizza_changed_in_place(self):
+        self.pizza2.cheese.append(PizzaIngredients.PARMESAN)
+        self.assertIn(self.pizza2, self.pizza_menu)
+        self.pizza_menu.remove_pizza(self.pizza2)
+        self.assertNotIn(self.pizza2, self.pizza_menu)
+        self.assertEqual(len(self.pizza_menu), 3)
+        self.pizza3.meat = []
+        self.pizza_menu.reindex()
+        self.assertIn(Pizza(dough=PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese=[PizzaIngredients.CHEDDAR], vegetables=[PizzaIngredients.MUSHROOMS]), self.pizza_menu)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,178 @@
+import itertools
+import unittest
+import unittest.mock
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import INGREDIENT_CATALOG, IngredientCatalog, IngredientType, PizzaIngredients
+from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.pizza_optimizer import (
+    PizzaConstraintsIngredients,
+    PizzaConstraintsValues,
+    InfeasiblePizzaError,
+    PizzaOptimizer,
+    PizzaRequest,
+    RISK_MODEL_CACHE_SIZE,
+    ValueBounds,
+    maximize_taste_penalty_price,
+    maximize_taste_penalty_risk,
+    minimize_price,
+    solve_many,
+    taste_price_frontier,
+    top_k_maximize_taste_penalty_price,
+    top_k_minimize_price,
+)
+
+
+def _brute_force_pizzas(constraints_ingredients):
+    by_type = {ingredient_type: [ingredient for ingredient in PizzaIngredients if ingredient.value.type == ingredient_type] for ingredient_type in IngredientType}
+    for dough, sauce, cheese, fruits, meat, vegetables in itertools.product(
+        by_type[IngredientType.DOUGH],
+        by_type[IngredientType.SAUCE],
+        itertools.combinations(by_type[IngredientType.CHEESE], constraints_ingredients.cheese),
+        itertools.combinations(by_type[IngredientType.FRUIT], constraints_ingredients.fruits),
+        itertools.combinations(by_type[IngredientType.MEAT], constraints_ingredients.meat),
+        itertools.combinations(by_type[IngredientType.VEGETABLE], constraints_ingredients.vegetables),
+    ):
+        yield Pizza(dough=dough, sauce=sauce, cheese=list(cheese), fruits=list(fruits), meat=list(meat), vegetables=list(vegetables))
+
+
+class TestPizzaOptimizer(unittest.TestCase):
+
+    def setUp(self):
+        self.constraints_values = PizzaConstraintsValues(calories=ValueBounds(min=500, max=1200))
+        self.constraints_ingredients = PizzaConstraintsIngredients(cheese=1, meat=1, vegetables=2)
+        self.feasible = [
+            pizza for pizza in _brute_force_pizzas(self.constraints_ingredients)
+            if 500 <= pizza.calories <= 1200
+        ]
+
+    def test_minimize_price(self):
+        for backend in ["mip", "enumeration"]:
+            pizza = minimize_price(self.constraints_values, self.constraints_ingredients, backend=backend)
+            self.assertAlmostEqual(pizza.price, min(pizza.price for pizza in self.feasible))
+            self.assertTrue(500 <= pizza.calories <= 1200)
+
+    def test_maximize_taste_penalty_price(self):
+        for backend, lambda_param in itertools.product(["mip", "enumeration"], [0.0, 0.5, 5.0]):
+            pizza = maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, lambda_param, backend=backend)
+            best = max(candidate.taste.mean() - lambda_param * candidate.price for candidate in self.feasible)
+            self.assertAlmostEqual(pizza.taste.mean() - lambda_param * pizza.price, best)
+
+    def test_enumerated_candidates(self):
+        optimizer = PizzaOptimizer()
+        compositions, _ = optimizer.candidates(self.constraints_ingredients)
+        self.assertEqual(len(compositions), len(list(_brute_force_pizzas(self.constraints_ingredients))))
+        self.assertEqual(len({tuple(composition) for composition in compositions}), len(compositions))
+        with self.assertRaises(Exception):
+            optimizer.minimize_price(PizzaConstraintsValues(calories=ValueBounds(max=10)), self.constraints_ingredients, backend="enumeration")
+        for backend in ["auto", "mip", "enumeration"]:
+            with self.assertRaises(InfeasiblePizzaError):
+                optimizer.minimize_price(PizzaConstraintsValues(), PizzaConstraintsIngredients(cheese=-1), backend=backend)
+
+    def test_reused_model_and_infeasibility(self):
+        optimizer = PizzaOptimizer(backend="mip")
+        cheap = optimizer.minimize_price(self.constraints_values, self.constraints_ingredients)
+        with self.assertRaises(Exception):
+            optimizer.minimize_price(PizzaConstraintsValues(price=ValueBounds(), calories=ValueBounds(max=10)), self.constraints_ingredients)
+        self.assertEqual(optimizer.minimize_price(self.constraints_values, self.constraints_ingredients).name, cheap.name)
+        self.assertEqual(optimizer.model.num_rows, 2 * 4 + 6)
+
+    def test_taste_price_frontier(self):
+        frontier = taste_price_frontier(self.constraints_values, self.constraints_ingredients, 0.0, 50.0)
+        self.assertEqual(frontier.segments[0].lambda_min, 0.0)
+        self.assertEqual(frontier.segments[-1].lambda_max, 50.0)
+        self.assertEqual(len({segment.pizza.name for segment in frontier.segments}), len(frontier.segments))
+        for lambda_param in np.linspace(0.0, 50.0, 26):
+            best = max(candidate.taste.mean() - lambda_param * candidate.price for candidate in self.feasible)
+            segment = next(segment for segment in frontier.segments if segment.lambda_min <= lambda_param <= segment.lambda_max)
+            self.assertAlmostEqual(segment.expected_taste - lambda_param * segment.price, best)
+
+    def test_top_k(self):
+        expected_prices = sorted(pizza.price for pizza in self.feasible)[:7]
+        expected_objectives = sorted((pizza.taste.mean() - 0.5 * pizza.price for pizza in self.feasible), reverse=True)[:7]
+        for backend in ["mip", "enumeration"]:
+            menu = top_k_minimize_price(self.constraints_values, self.constraints_ingredients, 7, backend=backend)
+            np.testing.assert_allclose([pizza.price for pizza in menu.pizzas], expected_prices)
+            self.assertEqual(len({pizza.name for pizza in menu.pizzas}), 7)
+            menu = top_k_maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, 7, 0.5, backend=backend)
+            np.testing.assert_allclose([pizza.taste.mean() - 0.5 * pizza.price for pizza in menu.pizzas], expected_objectives)
+            small = PizzaConstraintsIngredients(cheese=1, meat=1)
+            menu = top_k_minimize_price(PizzaConstraintsValues(), small, 100, backend=backend)
+            self.assertEqual(len(menu), len(list(_brute_force_pizzas(small))))
+            with self.assertRaises(ValueError):
+                top_k_minimize_price(PizzaConstraintsValues(), small, -1, backend=backend)
+
+    def test_maximize_taste_penalty_risk(self):
+        names = set()
+        for backend in ["mip", "enumeration"]:
+            pizza = maximize_taste_penalty_risk(self.constraints_values, self.constraints_ingredients, 0.5, 1.0, 0.05, backend=backend)
+            names.add(pizza.name)
+        self.assertEqual(len(names), 1)
+        best = max(self.feasible, key=lambda pizza: np.sort(pizza.taste)[:50].mean() - 0.5 * pizza.price)
+        self.assertEqual(names.pop(), best.name)
+        self.assertEqual(
+            maximize_taste_penalty_risk(self.constraints_values, self.constraints_ingredients, 0.5, 0.0).name,
+            maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, 0.5).name,
+        )
+        for backend in ["mip", "enumeration"]:
+            pizza = maximize_taste_penalty_risk(self.constraints_values, self.constraints_ingredients, 0.5, 2.0, 0.1, n_scenarios=200, seed=1, backend=backend)
+            names.add(pizza.name)
+        self.assertEqual(len(names), 1)
+
+    def test_risk_models_are_shared_and_bounded(self):
+        optimizer = PizzaOptimizer()
+        expected = optimizer.maximize_taste_penalty_risk(self.constraints_values, self.constraints_ingredients, backend="enumeration")
+        for seed in range(3):
+            pizza = optimizer.maximize_taste_penalty_risk(self.constraints_values, self.constraints_ingredients, n_scenarios=10**6, seed=seed, backend="mip")
+            self.assertEqual(pizza.name, expected.name)
+        self.assertEqual(len(optimizer._risk_models), 1)
+        for seed in range(RISK_MODEL_CACHE_SIZE + 2):
+            optimizer.maximize_taste_penalty_risk(self.constraints_values, self.constraints_ingredients, n_scenarios=20, seed=seed, backend="mip")
+        self.assertEqual(len(optimizer._risk_models), RISK_MODEL_CACHE_SIZE)
+        with unittest.mock.patch("maestro_pizza_maker.pizza_optimizer.RISK_SCORE_BLOCK", 1000):
+            pizza = optimizer.maximize_taste_penalty_risk(self.constraints_values, self.constraints_ingredients, backend="enumeration")
+        self.assertEqual(pizza.name, expected.name)
+
+    def test_solve_many(self):
+        requests = [
+            PizzaRequest(self.constraints_values, self.constraints_ingredients),
+            PizzaRequest(PizzaConstraintsValues(calories=ValueBounds(max=1)), self.constraints_ingredients),
+            PizzaRequest(self.constraints_values, self.constraints_ingredients, "maximize_taste_penalty_price", 0.5),
+            PizzaRequest(self.constraints_values, self.constraints_ingredients),
+            PizzaRequest(objective="unknown"),
+        ]
+        for n_jobs in [1, 2]:
+            results = solve_many(requests, n_jobs=n_jobs)
+            self.assertEqual([result.status for result in results], ["optimal", "infeasible", "optimal", "optimal", "error"])
+            self.assertEqual(results[0].pizza.name, minimize_price(self.constraints_values, self.constraints_ingredients).name)
+            self.assertEqual(results[2].pizza.name, maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, 0.5).name)
+            self.assertEqual(results[3].pizza.name, results[0].pizza.name)
+            self.assertIsNot(results[3].pizza, results[0].pizza)
+        with self.assertRaises(InfeasiblePizzaError):
+            minimize_price(requests[1].constraints_values, self.constraints_ingredients)
+
+    def test_batches_on_a_loaded_catalog(self):
+        columns = INGREDIENT_CATALOG.columns()
+        nutrients = INGREDIENT_CATALOG.nutrients.copy()
+        # reversed prices -> another cheapest pizza than on the built-in catalog
+        nutrients[:, 0] = nutrients[:, 0].max() + 1 - nutrients[:, 0]
+        catalog = IngredientCatalog.from_columns(keys=columns["key"], types=columns["type"], nutrients=nutrients)
+        optimizer = PizzaOptimizer(catalog=catalog)
+        expected = optimizer.minimize_price(self.constraints_values, self.constraints_ingredients)
+        self.assertNotEqual(expected.name, minimize_price(self.constraints_values, self.constraints_ingredients).name)
+        requests = [
+            PizzaRequest(self.constraints_values, self.constraints_ingredients),
+            PizzaRequest(self.constraints_values, self.constraints_ingredients, "maximize_taste_penalty_price", 0.5),
+        ]
+        for n_jobs in [1, 2]:
+            results = solve_many(requests, n_jobs=n_jobs, catalog=catalog)
+            self.assertEqual(results[0].pizza.name, expected.name)
+            self.assertEqual(results[1].pizza.name, optimizer.maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, 0.5).name)
+            self.assertIs(results[0].pizza.catalog, catalog)
+        frontier = taste_price_frontier(self.constraints_values, self.constraints_ingredients, 0.0, 50.0, n_jobs=2, catalog=catalog)
+        self.assertIs(frontier.segments[0].pizza.catalog, catalog)
+        self.assertEqual(frontier.segments[-1].pizza.name, optimizer.maximize_taste_penalty_price(self.constraints_values, self.constraints_ingredients, 50.0).name)
+
+if __name__ == '__main__':
+    unittest.main()
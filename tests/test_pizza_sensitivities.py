@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import PizzaIngredients
+from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.pizza_menu import PizzaMenu
+from maestro_pizza_maker.pizza_sensitivities import (
+    batched_slopes,
+    bootstrap_sensitivities,
+    menu_sensitivities,
+    menu_sensitivity_carbs,
+    menu_sensitivity_fat,
+    menu_sensitivity_protein,
+)
+
+
+class TestPizzaSensitivities(unittest.TestCase):
+
+    def setUp(self):
+        self.pizza_menu = PizzaMenu(pizzas=[
+            Pizza(sauce=PizzaIngredients.CREAM_SAUCE, dough=PizzaIngredients.CLASSIC_DOUGH),
+            Pizza(dough=PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, cheese=[PizzaIngredients.MOZZARELA]),
+            Pizza(dough=PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese=[PizzaIngredients.CHEDDAR], meat=[PizzaIngredients.HAM], vegetables=[PizzaIngredients.MUSHROOMS]),
+            Pizza(dough=PizzaIngredients.CLASSIC_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese=[PizzaIngredients.MOZZARELA], vegetables=[PizzaIngredients.ONIONS, PizzaIngredients.PEPPER]),
+            Pizza(dough=PizzaIngredients.WHOLEMEAL_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, cheese=[PizzaIngredients.PARMESAN], fruits=[PizzaIngredients.APPLE], vegetables=[PizzaIngredients.ONIONS]),
+        ])
+        self.prices = np.array([pizza.price for pizza in self.pizza_menu.pizzas])
+
+    def test_slopes_match_least_squares(self):
+        for sensitivity, attribute in [
+            (menu_sensitivity_protein, "protein"),
+            (menu_sensitivity_carbs, "carbohydrates"),
+            (menu_sensitivity_fat, "average_fat"),
+        ]:
+            feature = np.array([getattr(pizza, attribute) for pizza in self.pizza_menu.pizzas])
+            self.assertAlmostEqual(sensitivity(self.pizza_menu), np.polyfit(feature, self.prices, 1)[0])
+
+    def test_standard_errors_and_multivariate(self):
+        result = menu_sensitivities(self.pizza_menu, standard_errors=True, multivariate=True)
+        feature = np.array([pizza.protein for pizza in self.pizza_menu.pizzas])
+        _, covariance = np.polyfit(feature, self.prices, 1, cov="unscaled")
+        residuals = self.prices - np.polyval(np.polyfit(feature, self.prices, 1), feature)
+        self.assertAlmostEqual(result.standard_errors[0], np.sqrt(covariance[0, 0] * residuals @ residuals / 3))
+        features = np.column_stack([[pizza.protein, pizza.carbohydrates, pizza.average_fat, 1.0] for pizza in self.pizza_menu.pizzas]).T
+        expected = np.linalg.lstsq(features, self.prices, rcond=None)[0]
+        np.testing.assert_allclose(np.append(result.coefficients, result.intercept), expected, atol=1e-8)
+
+    def test_constant_feature(self):
+        menu = PizzaMenu(pizzas=self.pizza_menu.pizzas[:1] * 2)
+        self.assertEqual(menu_sensitivity_protein(menu), 0.0)
+
+    def test_too_few_pizzas(self):
+        for pizzas in [[], self.pizza_menu.pizzas[:1]]:
+            menu = PizzaMenu(pizzas=pizzas, track_statistics=True)
+            with self.assertRaises(ValueError):
+                menu_sensitivity_protein(menu)
+            with self.assertRaises(ValueError):
+                menu_sensitivities(PizzaMenu(pizzas=pizzas))
+
+    def test_bootstrap(self):
+        result = bootstrap_sensitivities(self.pizza_menu, n_resamples=300, chunk_size=64, seed=1)
+        self.assertEqual(result.samples.shape, (300, 3))
+        self.assertTrue(np.all(result.lower <= result.upper))
+        protein = np.array([pizza.protein for pizza in self.pizza_menu.pizzas])
+        indices = np.array([[0, 0, 2, 3, 4], [1, 1, 1, 1, 1]])
+        slopes = batched_slopes(protein[indices][:, :, None], self.prices[indices])
+        np.testing.assert_allclose(slopes[:, 0], [np.polyfit(protein[indices[0]], self.prices[indices[0]], 1)[0], 0.0])
+        parallel = bootstrap_sensitivities(self.pizza_menu, n_resamples=300, chunk_size=64, seed=1, n_jobs=2, resample_fat=True)
+        np.testing.assert_allclose(parallel.samples[:, :2], result.samples[:, :2])
+        self.assertFalse(np.allclose(parallel.samples[:, 2], result.samples[:, 2]))
+
+    def test_tracked_statistics(self):
+        menu = PizzaMenu(pizzas=self.pizza_menu.pizzas[:2], track_statistics=True)
+        for pizza in self.pizza_menu.pizzas[2:]:
+            menu.add_pizza(pizza)
+        menu.remove_pizza(self.pizza_menu.pizzas[1])
+        menu.add_pizza(self.pizza_menu.pizzas[1])
+        menu.remove_pizza(self.pizza_menu.pizzas[3])
+        self.assertEqual(menu.statistics.n, 4)
+        tracked = menu_sensitivities(menu, standard_errors=True, multivariate=True)
+        expected = menu_sensitivities(PizzaMenu(pizzas=list(menu.pizzas)), standard_errors=True, multivariate=True)
+        for attribute in ["slopes", "intercepts", "standard_errors", "coefficients"]:
+            np.testing.assert_allclose(getattr(tracked, attribute), getattr(expected, attribute), atol=1e-10)
+        self.assertIsNone(self.pizza_menu.statistics)
+
+if __name__ == '__main__':
+    unittest.main()
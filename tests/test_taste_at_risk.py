@@ -0,0 +1,138 @@
+import unittest
+
+import numpy as np
+
+from maestro_pizza_maker.ingredients import INGREDIENT_CATALOG, PizzaIngredients
+from maestro_pizza_maker.pizza import Pizza
+from maestro_pizza_maker.pizza_menu import PizzaMenu
+from maestro_pizza_maker.streaming_taste_at_risk import StreamingTasteAtRisk, streaming_taste_at_risk
+from maestro_pizza_maker.sand_box.fat_generator import FatDistribution, inverse_normal_cdf
+from maestro_pizza_maker.taste_risk_attribution import MenuRiskAttribution
+from maestro_pizza_maker.taste_at_risk import (
+    SIMULATION_METHODS,
+    conditional_taste_at_risk_menu,
+    conditional_taste_at_risk_pizza,
+    menu_taste,
+    gaussian_risk_diagnostic,
+    gaussian_taste_risk_table,
+    taste_at_risk_menu,
+    taste_at_risk_pizza,
+    simulated_taste_risk,
+    taste_risk,
+    taste_risk_table,
+    weighted_taste_risk,
+)
+
+
+class TestTasteAtRisk(unittest.TestCase):
+
+    def setUp(self):
+        self.pizza1 = Pizza(dough = PizzaIngredients.CLASSIC_DOUGH, sauce=PizzaIngredients.TOMATO_SAUCE, cheese = [PizzaIngredients.MOZZARELA])
+        self.pizza2 = Pizza(dough = PizzaIngredients.THIN_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, meat = [PizzaIngredients.HAM], fruits=[PizzaIngredients.PINEAPPLE])
+        self.pizza_menu = PizzaMenu(pizzas=[self.pizza1, self.pizza2])
+
+    def test_menu_taste_is_sum_of_pizzas(self):
+        taste = self.pizza1.taste + self.pizza2.taste
+        self.assertAlmostEqual(taste_at_risk_menu(self.pizza_menu, 0.05), np.percentile(taste, 5))
+        self.assertAlmostEqual(conditional_taste_at_risk_menu(self.pizza_menu, 0.05), np.mean(taste[taste <= np.percentile(taste, 5)]))
+
+    def test_streaming_exact(self):
+        for quantile in [0.01, 0.05, 0.25]:
+            estimate = streaming_taste_at_risk(self.pizza1, INGREDIENT_CATALOG.fat_chunks(64), quantile, tail_capacity=300)
+            self.assertTrue(estimate.exact)
+            self.assertAlmostEqual(estimate.taste_at_risk, taste_at_risk_pizza(self.pizza1, quantile))
+            self.assertAlmostEqual(estimate.conditional_taste_at_risk, conditional_taste_at_risk_pizza(self.pizza1, quantile))
+
+    def test_streaming_approximate(self):
+        rng = np.random.default_rng(0)
+        taste = rng.normal(size=200_000)
+        estimator = StreamingTasteAtRisk(0.1, tail_capacity=1_000, reservoir_size=20_000)
+        for chunk in np.array_split(taste, 20):
+            estimator.update(chunk)
+        estimate = estimator.result()
+        self.assertFalse(estimate.exact)
+        tar = np.percentile(taste, 10)
+        self.assertLess(abs(estimate.taste_at_risk - tar), estimate.taste_at_risk_error)
+        self.assertLess(abs(estimate.conditional_taste_at_risk - np.mean(taste[taste <= tar])), 2 * estimate.conditional_taste_at_risk_error + 0.01)
+
+    def test_taste_risk_table(self):
+        quantiles = [0.01, 0.05, 0.1, 0.25]
+        table = taste_risk_table([self.pizza1, self.pizza2, self.pizza_menu], quantiles)
+        for j, quantile in enumerate(quantiles):
+            for i, pizza in enumerate([self.pizza1, self.pizza2]):
+                self.assertAlmostEqual(table.taste_at_risk[i, j], taste_at_risk_pizza(pizza, quantile))
+                self.assertAlmostEqual(table.conditional_taste_at_risk[i, j], conditional_taste_at_risk_pizza(pizza, quantile))
+            self.assertAlmostEqual(table.taste_at_risk[2, j], taste_at_risk_menu(self.pizza_menu, quantile))
+            self.assertAlmostEqual(table.conditional_taste_at_risk[2, j], conditional_taste_at_risk_menu(self.pizza_menu, quantile))
+        self.assertEqual(table.to_dataframe().shape, (3, 8))
+
+    def test_inverse_normal_cdf(self):
+        np.testing.assert_allclose(
+            inverse_normal_cdf(np.array([0.001, 0.01, 0.05, 0.5, 0.975, 0.999])),
+            [-3.090232306167813, -2.326347874040841, -1.6448536269514729, 0.0, 1.959963984540054, 3.090232306167813],
+            rtol=1e-8, atol=1e-12,
+        )
+
+    def test_weighted_taste_risk(self):
+        taste = np.random.default_rng(0).normal(size=(2, 1000))
+        tar, ctar = weighted_taste_risk(taste, np.ones(1000), [0.05, 0.2])
+        _, expected_ctar = taste_risk(taste, [0.05, 0.2])
+        np.testing.assert_allclose(ctar, expected_ctar)
+        # the weighted TaR is the order statistic, not np.percentile's interpolation
+        np.testing.assert_allclose(tar, np.sort(taste, axis=1)[:, [49, 199]])
+
+    def test_simulated_taste_risk(self):
+        expected_tar, expected_ctar = simulated_taste_risk(self.pizza_menu, [0.05], 200_000, seed=1)
+        for method in SIMULATION_METHODS:
+            tar, ctar = simulated_taste_risk(self.pizza_menu, [0.05], 20_000, method, seed=2)
+            self.assertAlmostEqual(tar[0], expected_tar[0], delta=0.02 * abs(expected_tar[0]))
+            self.assertAlmostEqual(ctar[0], expected_ctar[0], delta=0.02 * abs(expected_ctar[0]))
+
+    def test_gaussian_taste_risk(self):
+        table = gaussian_taste_risk_table([self.pizza1, self.pizza_menu], [0.01, 0.05])
+        self.assertEqual(table.taste_at_risk.shape, (2, 2))
+        # the clipping is negligible for the built-in catalog -> close to a large simulation
+        tar, ctar = simulated_taste_risk(self.pizza_menu, [0.01, 0.05], 200_000, "sobol")
+        np.testing.assert_allclose(table.taste_at_risk[1], tar, rtol=0.01)
+        np.testing.assert_allclose(table.conditional_taste_at_risk[1], ctar, rtol=0.01)
+        self.assertTrue(np.all(table.conditional_taste_at_risk < table.taste_at_risk))
+
+    def test_gaussian_risk_diagnostic(self):
+        diagnostic = gaussian_risk_diagnostic([self.pizza1, self.pizza2, self.pizza_menu], [0.01, 0.05])
+        self.assertEqual(diagnostic.taste_at_risk_error.shape, (3, 2))
+        self.assertTrue(np.all(diagnostic.clipping_probability < 1e-3))
+        self.assertFalse(diagnostic.inaccurate.any())
+        self.assertTrue(np.all(diagnostic.conditional_taste_at_risk_standard_error > 0))
+        # fat means near the clipping bound: the closed forms ignore the clipped lower tail
+        base = INGREDIENT_CATALOG.fat_distribution()
+        clipped = FatDistribution(mean=np.full(base.dim, 1.0), cov=base.cov)
+        diagnostic = gaussian_risk_diagnostic([self.pizza1, self.pizza2], [0.01, 0.05], distribution=clipped)
+        self.assertTrue(np.all(diagnostic.clipping_probability > 0.5))
+        self.assertTrue(diagnostic.inaccurate.all())
+        self.assertTrue(np.all(diagnostic.gaussian.taste_at_risk < diagnostic.empirical.taste_at_risk))
+
+    def test_risk_attribution(self):
+        attribution = MenuRiskAttribution(self.pizza_menu, 0.05).attribution()
+        expected = conditional_taste_at_risk_menu(self.pizza_menu, 0.05)
+        self.assertAlmostEqual(attribution.conditional_taste_at_risk, expected)
+        self.assertAlmostEqual(attribution.pizzas.sum(), expected)
+        self.assertAlmostEqual(attribution.ingredients.sum(), expected)
+        self.assertEqual(attribution.pizza_names, [self.pizza1.name, self.pizza2.name])
+
+    def test_risk_what_if(self):
+        pizza3 = Pizza(dough=PizzaIngredients.CLASSIC_DOUGH, sauce=PizzaIngredients.CREAM_SAUCE, vegetables=[PizzaIngredients.MUSHROOMS])
+        attribution = MenuRiskAttribution(self.pizza_menu, 0.05)
+        _, ctar = attribution.with_pizza(pizza3)
+        self.assertAlmostEqual(ctar, conditional_taste_at_risk_menu(PizzaMenu(pizzas=[self.pizza1, self.pizza2, pizza3]), 0.05))
+        _, ctar = attribution.without_pizza(self.pizza1)
+        self.assertAlmostEqual(ctar, conditional_taste_at_risk_menu(PizzaMenu(pizzas=[self.pizza2]), 0.05))
+        with self.assertRaises(ValueError):
+            attribution.without_pizza(pizza3)
+        effects = attribution.removal_effects()
+        self.assertAlmostEqual(effects[0], ctar - conditional_taste_at_risk_menu(self.pizza_menu, 0.05))
+        attribution.add_pizza(pizza3)
+        self.assertEqual(len(self.pizza_menu), 3)
+        np.testing.assert_allclose(attribution.taste, menu_taste(self.pizza_menu))
+
+if __name__ == '__main__':
+    unittest.main()